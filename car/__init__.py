@@ -0,0 +1,4 @@
+import time
+
+# for the startup report (car.startup), from as early as possible
+IMPORT_STARTED = time.perf_counter()
@@ -1,9 +1,10 @@
 # stdlib
 import functools
+import hashlib
 import itertools
 import json
+import logging
 import os
-import random
 import secrets
 import time
 from collections.abc import Callable
@@ -12,6 +13,7 @@ from typing import Any, TypedDict, cast
 # 3p
 from flask import (
     Flask,
+    Response,
     abort,
     flash,
     g,
@@ -23,10 +25,12 @@ from flask import (
     session,
     url_for,
 )
+from markupsafe import Markup
 from typing_extensions import TypeIs
 
 # project
-from . import householding, utils
+from . import householding, startup, utils
+from .cache import MemoryCache, get_cache
 from .model import (
     DATA_ROOT,
     DISPOSITIONS,
@@ -41,7 +45,14 @@ from .model import (
     Voter,
     is_valid_disposition,
     is_valid_type,
+    normalize_phone,
 )
+from .pairing import RETRY_SECS, Pairings, TooManyWaiters
+from .phonebank import PhonebankQueues
+from .progress import ProgressTracker
+from .search import AddressIndex, NameIndex
+from .storage import get_hot_reloader, sync_databases
+from .turfview import TurfView
 
 PHONEBANK_MIN_DELAY = 60 * 15
 
@@ -83,32 +94,43 @@ SETTINGS_KEYS: Session = {
 BASE_URL = "https://car.yourallyinmontgomery.org"
 
 app = Flask(__name__)
-cache = utils.MemoryCache()
+cache = get_cache()
 
-
-class Phone(TypedDict, total=False):
-    zoom_phone: int
-    data: str
-    voter: ID | None
-    seen: float
+# under gunicorn, log (the startup report, hot reloads, ...) through its
+# handlers and at its --log-level
+if (gunicorn_logger := logging.getLogger("gunicorn.error")).handlers:
+    logging.getLogger("car").handlers = gunicorn_logger.handlers
+    logging.getLogger("car").setLevel(gunicorn_logger.level)
 
 
-phones: dict[str, Phone] = {}
+pairings = Pairings(cache, shared=not isinstance(cache, MemoryCache))
 
 os.chdir(DATA_ROOT)
 
-if not os.path.exists("secret_key.txt"):
-    with open("secret_key.txt", "w") as f:
-        f.write(secrets.token_hex())
 
+def create_once(path: str, contents: str):
+    """Write `path` unless it exists, such that every worker starting at once
+    ends up reading the same contents"""
+    if os.path.exists(path):
+        return
+
+    tmp = f"{path}.{os.getpid()}"
+    with open(tmp, "w") as f:
+        f.write(contents)
+    try:
+        os.link(tmp, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.unlink(tmp)
+
+
+create_once("secret_key.txt", secrets.token_hex())
 with open("secret_key.txt") as f:
     app.secret_key = f.read()
 
 if not (password := os.getenv("CAR_ADMIN_PASSWORD")):
-    if not os.path.exists("password.txt"):
-        with open("password.txt", "w") as f:
-            f.write("e")
-
+    create_once("password.txt", "e")
     with open("password.txt") as f:
         password = f.read().strip()
 
@@ -118,6 +140,75 @@ if os.path.exists("turfs.geojson"):
         geoturfs = json.load(f)
 
 
+# ETags and fragment cache keys depend on in-memory version counters, which
+# start over with the process
+BOOT_ID = secrets.token_hex(8)
+# pages show times like "5min ago", so let them go at most this stale
+ETAG_MAX_STALE_SECS = 60
+FRAGMENT_CACHE_SIZE = int(os.getenv("CAR_FRAGMENT_CACHE_SIZE", "500"))
+
+# rendered page fragments (see cached_fragment)
+fragment_cache = MemoryCache(max_size=FRAGMENT_CACHE_SIZE)
+
+
+def not_modified(*models: Model) -> Response | None:
+    """Set an ETag for the current page from the versions of the records (and
+    their notes) it shows, plus everything else it depends on: the URL, the
+    session and the time. Returns a 304 if the browser already has it.
+
+    Also sets g.data_version, for cached_fragment."""
+    record_keys = [(f"{m.TYPE}s", m.id) for m in models]
+    note_keys = [(m.TYPE, m.id_for_notes()) for m in models]
+    versions = [
+        record_keys,
+        note_keys,
+        db.versions(record_keys),
+        note_db.versions(note_keys),
+    ]
+    g.data_version = hashlib.blake2b(
+        json.dumps(versions).encode(), digest_size=16
+    ).hexdigest()
+
+    state = [
+        BOOT_ID,
+        int(time.time() // ETAG_MAX_STALE_SECS),
+        request.full_path,
+        dict(session),
+        g.data_version,
+    ]
+    g.etag = hashlib.blake2b(
+        json.dumps(state, sort_keys=True, default=str).encode(), digest_size=16
+    ).hexdigest()
+
+    if g.etag in request.if_none_match:
+        resp = make_response("", 304)
+        resp.set_etag(g.etag)
+        return resp
+
+    return None
+
+
+def cached_fragment(name: str, *settings: Any, caller: Callable[[], str]) -> Markup:
+    """Render the body of a `{% call cached_fragment(name, settings...) %}`
+    block once per version of the data the page shows (g.data_version, from
+    not_modified), so canvassers sharing a turf don't each pay for it.
+    `settings` has to cover everything else the block reads from the session
+    or request."""
+    key = repr(
+        (
+            name,
+            g.data_version,
+            int(time.time() // ETAG_MAX_STALE_SECS),
+            *settings,
+        )
+    )
+    if (html := fragment_cache.get(key)) is None:
+        html = str(caller())
+        fragment_cache.set(key, html)
+
+    return Markup(html)
+
+
 def browser_cache(f):
     @functools.wraps(f)
     def wrapped(*a, **k):
@@ -125,6 +216,9 @@ def browser_cache(f):
         resp = make_response(r)
         if request.headers.get("HX-Preloaded"):
             resp.headers["Cache-Control"] = "private, max-age=600"
+        elif "etag" in g and resp.status_code == 200:
+            resp.set_etag(g.etag)
+            resp.headers["Cache-Control"] = "private, no-cache"
         return resp
 
     return wrapped
@@ -132,6 +226,11 @@ def browser_cache(f):
 
 @app.before_request
 def before_request():
+    g.request_started = time.perf_counter()
+
+    # pick up whatever other workers have committed since the last request
+    sync_databases()
+
     g.phonebank = False
     if session.get("phonebank"):
         g.phonebank = True
@@ -150,6 +249,7 @@ def before_request():
         "static",
         "pair_phone",
         "pair_phone_status",
+        "pair_phone_wait",
         "phone_voter_html",
     } and not request.path.startswith("/login/"):
         if "favicon" in request.url:
@@ -161,6 +261,8 @@ def before_request():
 
 @app.after_request
 def after_request(resp):
+    startup.first_request(request.path, time.perf_counter() - g.request_started)
+
     if request.method == "POST" or hasattr(g, "commit"):
         session["last_commit"] = time.time()
 
@@ -201,8 +303,8 @@ def ensure_voter_accessible(voter: Voter):
         # also check householding info for phonebanking
         # (if the last voter we worked on is in the household, then it's ok)
 
-        for voter_set in householding.household_info_by_phones(voter).values():
-            if session.get("chosen_voter") in [v.id for v in voter_set]:
+        for voter_ids in householding.household_ids_by_phones(voter).values():
+            if session.get("chosen_voter") in voter_ids:
                 return
 
     if voter.id in session.get("voters_searched", []):
@@ -215,7 +317,7 @@ def ensure_voter_accessible(voter: Voter):
     turf_id = session.get("last_turf")
     assert ensure_turf_accessible(turf_id)
 
-    if voter.id not in db.get_turf_by_id(turf_id).voters:
+    if voter.id not in db.view_turf_by_id(turf_id).voters:
         abort(403)
 
 
@@ -226,7 +328,7 @@ def ensure_door_accessible(door: Door):
     turf_id = session.get("last_turf")
     assert ensure_turf_accessible(turf_id)
 
-    if door.id not in db.get_turf_by_id(turf_id).doors:
+    if door.id not in db.view_turf_by_id(turf_id).doors:
         abort(403)
 
 
@@ -277,16 +379,15 @@ def login(login_code=None):
         else:
             pw = "".join([i for i in pw if i.isnumeric()])
 
-        for turf in db.turfs:
-            if turf.login_code == pw:
-                break
-
-        else:
+        turf_id = db.lookup("turf_login_code", pw)
+        if turf_id is None:
             if request.method == "POST":
                 flash("No such turf code! Try again.")
 
             return render_template("login.html")
 
+        turf = db.view_turf_by_id(turf_id)
+
         if "turfs" not in session:
             session["turfs"] = []
 
@@ -311,8 +412,28 @@ def logout():
     return redirect(url_for("login"))
 
 
+startup.record("import", startup.since_import())
 db = Database.get()
 note_db = NoteDatabase.get()
+phonebank_queues = PhonebankQueues(db, note_db, cache, PHONEBANK_MIN_DELAY)
+get_hot_reloader().start()
+startup.ready()
+
+
+# built on first use, rather than holding up startup
+@functools.cache
+def get_name_index() -> NameIndex:
+    return NameIndex(db)
+
+
+@functools.cache
+def get_address_index() -> AddressIndex:
+    return AddressIndex(db)
+
+
+@functools.cache
+def get_progress() -> ProgressTracker:
+    return ProgressTracker(db, note_db)
 
 
 @app.context_processor
@@ -327,6 +448,7 @@ def inject_funcs() -> dict[str, Callable[..., Any]]:
         "tel_uri": tel_uri,
         "time_taken": utils.time_taken,
         "hex": hex,
+        "cached_fragment": cached_fragment,
     }
 
 
@@ -338,13 +460,20 @@ def inject_constants() -> dict[str, Any]:
     }
 
 
+def phone_digits(k: str) -> str:
+    if (phone := normalize_phone(k)) is not None:
+        return f"{phone:010}"
+
+    return "".join([i for i in k if i.isnumeric()])
+
+
 def reformat_phone(k: str) -> str:
-    k = "".join([i for i in k if i.isnumeric()])
+    k = phone_digits(k)
     return f"({k[:3]}) {k[3:6]}-{k[6:]}"
 
 
 def tel_uri(k: str, tel: str = "tel") -> str:
-    k = "".join([i for i in k if i.isnumeric()])
+    k = phone_digits(k)
 
     if session.get("zoom_phone") and tel == "tel":
         return f"zoomphonecall://+1{k:10}"
@@ -352,10 +481,6 @@ def tel_uri(k: str, tel: str = "tel") -> str:
     return f"{tel}:+1{k[:10]}"
 
 
-def is_phone(k: str):
-    return len([i for i in k if i.isnumeric()]) > 7
-
-
 @app.route("/")
 def index():
     if not session.get("admin") and len(session.get("turfs", [])) == 1:
@@ -374,13 +499,14 @@ def index():
     return render_template(
         "index.html",
         geoturfs=my_geoturfs,
+        progress=get_progress(),
         turf_data=[
             {
                 "visible": t.visible,
                 "doors": len(t.doors),
                 "voters": len(t.voters),
-                "disposition": t.last_disposition(),
-                "disposition_name": DISPOSITIONS[t.last_disposition()],
+                "disposition": (disposition := get_progress().get(t.id).disposition),
+                "disposition_name": DISPOSITIONS[disposition],
             }
             for t in db.turfs
         ],
@@ -422,18 +548,21 @@ def search():
     session.pop("last_turf", None)
     session.pop("phonebank", None)
 
-    parts = query.strip().lower().split()
-
-    def matches_voter(v: Voter) -> bool:
-        return all(
-            part in " ".join(map(str, [v.firstname, v.lastname])).lower()
-            for part in parts
-        )
+    door_results = []
+    if phone := normalize_phone(query):
+        voter_ids = sorted(db.lookup_all("voter_phone", phone))[:20]
+    else:
+        voter_ids = get_name_index().search(query, limit=20)
+        door_results = [
+            db.view_door_by_id(id) for id in get_address_index().search(query)
+        ]
 
-    results = list(itertools.islice(filter(matches_voter, db.voters), 20))
+    results = [db.view_voter_by_id(id) for id in voter_ids]
     session["voters_searched"] = [v.id for v in results]
 
-    return render_template("search.html", query=query, results=results)
+    return render_template(
+        "search.html", query=query, results=results, door_results=door_results
+    )
 
 
 @app.route("/turf/<int:id>/")
@@ -441,7 +570,7 @@ def search():
 def show_turf(id: ID):
     assert ensure_turf_accessible(id)
 
-    turf = db.get_turf_by_id(id)
+    turf = db.view_turf_by_id(id)
 
     if session.get("last_turf") != id:
         session["last_turf"] = id
@@ -456,47 +585,29 @@ def show_turf(id: ID):
     if turf.phone_key:
         return redirect(url_for("phonebank_next_voter", turf_id=id))
 
-    geodoors: list[dict[str, Any]] = []
-    for door_id in turf.doors:
-        door = db.get_door_by_id(door_id)
-        geodoors.append(
-            {
-                "type": "Feature",
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [door.lon, door.lat],
-                },
-                "properties": {
-                    "address": door.address,
-                    "unit": door.unit,
-                    "n_voters": len(door.voters),
-                    "url": url_for("show_door", id=door.id),
-                    "disposition": db.get_disposition_for_type_and_id(
-                        "door", door.id, turf
-                    ),
-                },
-            }
-        )
+    doors = [db.doors[door_id] for door_id in turf.doors]
+    voter_ids = {voter_id for door in doors for voter_id in door.voters}
+    voters = [db.voters[voter_id] for voter_id in sorted(voter_ids)]
+    if resp := not_modified(turf, *doors, *voters):
+        return resp
 
-    pretty_ordered_doors = itertools.groupby(
-        sorted([db.get_door_by_id(d) for d in turf.doors], key=lambda d: d.sort_key()),
-        key=lambda d: d.print_order_key(),
-    )
+    @functools.cache
+    def load_turf_view():
+        # only needed when the page isn't already in the fragment cache
+        return TurfView(db, db.turfs[id])
+
+    def load_geodoors():
+        return load_turf_view().geojson(
+            lambda door_id: url_for("show_door", id=door_id)
+        )
 
     print_mode = "print" in request.args
 
     return render_template(
         "turf_print.html" if print_mode else "turf.html",
         turf=turf,
-        pretty_ordered_doors=pretty_ordered_doors,
-        geodoors={
-            "type": "FeatureCollection",
-            "crs": {
-                "type": "name",
-                "properties": {"name": "urn:ogc:def:crs:OGC:1.3:CRS84"},
-            },
-            "features": geodoors,
-        },
+        load_turf_view=load_turf_view,
+        load_geodoors=load_geodoors,
     )
 
 
@@ -504,7 +615,7 @@ def show_turf(id: ID):
 def start_turf(id):
     assert ensure_turf_accessible(id)
 
-    turf = db.get_turf_by_id(id)
+    turf = db.view_turf_by_id(id)
     turf.add_note(
         Note(
             author=g.canvasser,
@@ -522,7 +633,7 @@ def start_turf(id):
 def finish_turf(id):
     assert ensure_turf_accessible(id)
 
-    turf = db.get_turf_by_id(id)
+    turf = db.view_turf_by_id(id)
     turf.add_note(
         Note(
             author=g.canvasser,
@@ -539,20 +650,24 @@ def finish_turf(id):
 @app.route("/door/<int:id>/")
 @browser_cache
 def show_door(id: ID):
-    door = db.get_door_by_id(id)
+    door = db.view_door_by_id(id)
     ensure_door_accessible(door)
     last_turf = session.get("last_turf")
     assert ensure_turf_accessible(last_turf)
-    turf = db.get_turf_by_id(last_turf)
-    voters = [db.get_voter_by_id(voter_id) for voter_id in door.voters]
+    turf = db.view_turf_by_id(last_turf)
+    all_voters = [db.view_voter_by_id(voter_id) for voter_id in door.voters]
 
     # filter out "New Voter"
-    voters = [v for v in voters if not v.should_hide()]
+    voters = [v for v in all_voters if not v.should_hide()]
 
     # split out voters in our turf vs. just in household
     turf_voters = [v for v in voters if v.id in turf.voters]
     household_voters = [v for v in voters if v.id not in turf.voters]
 
+    # hidden voters still count towards the door's disposition
+    if resp := not_modified(door, turf, *all_voters):
+        return resp
+
     return render_template(
         "door.html",
         door=door,
@@ -563,7 +678,7 @@ def show_door(id: ID):
 
 @app.route("/door/<int:id>/contact/")
 def new_door_contact(id: ID):
-    door = db.get_door_by_id(id)
+    door = db.view_door_by_id(id)
 
     ensure_door_accessible(door)
 
@@ -586,7 +701,7 @@ def new_door_contact(id: ID):
 
 @app.route("/door/<int:id>/act/")
 def door_act(id: ID):
-    door = db.get_door_by_id(id)
+    door = db.view_door_by_id(id)
 
     ensure_door_accessible(door)
 
@@ -644,24 +759,34 @@ def door_act(id: ID):
 @app.route("/voter/<int:id>/")
 @browser_cache
 def show_voter(id: ID):
-    voter = db.get_voter_by_id(id)
+    voter = db.view_voter_by_id(id)
     if g.phonebank and session.get("phone_paired"):
         if not request.headers.get("HX-Preloaded"):
             # TODO do we wanna add more validation around this?
-            phones[session.get("phone_code", "")]["voter"] = id
+            # only wakes the phone if this is a different voter
+            pairings.update(session.get("phone_code", ""), voter=id)
 
     ensure_voter_accessible(voter)
 
+    phone_household = householding.household_info_by_phones(voter)
+    depends_on = [voter, *itertools.chain(*phone_household.values())]
+    if voter.door_id is not None:
+        depends_on.append(db.view_door_by_id(voter.door_id))
+    if (turf_id := session.get("last_turf")) is not None:
+        depends_on.append(db.view_turf_by_id(turf_id))
+    if resp := not_modified(*depends_on):
+        return resp
+
     return render_template(
         "voter.html",
         voter=voter,
-        phone_household=householding.household_info_by_phones(voter),
+        phone_household=phone_household,
     )
 
 
 @app.route("/voter/<int:id>/act/")
 def voter_act(id: ID):
-    voter = db.get_voter_by_id(id)
+    voter = db.view_voter_by_id(id)
 
     ensure_voter_accessible(voter)
 
@@ -747,17 +872,17 @@ def note_obj(typ: str, id: ID):
     if typ == "turf":
         assert ensure_turf_accessible(id)
     elif typ == "door":
-        ensure_door_accessible(db.get_door_by_id(id))
+        ensure_door_accessible(db.view_door_by_id(id))
         if request.method == "POST":
             session["last_door"] = id
     elif typ == "voter":
-        ensure_voter_accessible(v := db.get_voter_by_id(id))
+        ensure_voter_accessible(v := db.view_voter_by_id(id))
         if request.method == "POST":
             session["last_door"] = v.door_id
     # FIXME turf restriction
 
     assert is_valid_type(typ)
-    obj = db.get_by_type_and_id(typ, id)
+    obj = db.view_by_type_and_id(typ, id)
     if request.method == "GET":
         return render_template(
             "take_note.html",
@@ -835,33 +960,16 @@ def edit_voter(id: ID):
 @app.route("/next/<int:turf_id>/")
 def phonebank_next_voter(turf_id):
     assert ensure_turf_accessible(turf_id)
-    turf = db.get_turf_by_id(turf_id)
+    turf = db.view_turf_by_id(turf_id)
 
     if not turf.phone_key:
         return redirect(url_for("show_turf", id=turf_id))
 
-    # all voters in turf
-    sample = random.sample(turf.voters, len(turf.voters))
-    for voter_id in sample:
-        last_seen = cache.get(f"last_seen_{voter_id}")
-        if last_seen is not None and time.time() - last_seen < PHONEBANK_MIN_DELAY:
-            continue
-
-        voter = db.get_voter_by_id(voter_id)
-
-        # don't phonebank anyone who we've conversed with before
-        # TODO - use the phone_key to decide config
-        if voter.notes:
-            continue
-
-        # don't phonebank... you know, anyone without a phone...
-        # TODO - use phone_key=textbank to check SMS instead
-        if not is_phone(voter.bestphone):
-            continue
-
+    # leased to us for PHONEBANK_MIN_DELAY, so nobody else gets them meanwhile
+    voter_id = phonebank_queues.take(turf_id)
+    if voter_id is not None:
         session["previous_voter"] = session.get("chosen_voter")
         session["chosen_voter"] = voter_id
-        cache.set(f"last_seen_{voter_id}", time.time())
         return redirect(url_for("show_voter", id=voter_id, keep_previous=1))
 
     flash("No voters to contact in this phonebank.")
@@ -885,7 +993,7 @@ def phonebank_previous_voter():
 def pair_phone_generate_code():
     session["return_to"] = request.args.get("return", "/")
     phone_code = session["phone_code"] = secrets.token_hex()
-    phones[phone_code] = {"zoom_phone": session.get("zoom_phone", 0)}
+    pairings.create(phone_code, zoom_phone=session.get("zoom_phone", 0))
     qr_code = utils.qr_code(f"{BASE_URL}/pair_phone/{phone_code}/")
     return render_template("phone_pair.html", code=qr_code)
 
@@ -901,36 +1009,45 @@ def pair_phone_success():
 def pair_phone(code):
     if code == "unpair":
         session.pop("phone_paired")
-        phones[session.pop("phone_code")].update(
-            {
-                "data": "Phone unpaired.",
-                "voter": None,
-            }
-        )
+        pairings.update(session.pop("phone_code"), data="Phone unpaired.", voter=None)
         return redirect(request.args.get("return", "/"))
 
-    session["zoom_phone"] = phones[code].get("zoom_phone", 0)
-    phones[code].update({"seen": time.time(), "data": "Phone paired!", "voter": None})
+    if (phone := pairings.get(code)) is None:
+        abort(404)
+
+    session["zoom_phone"] = phone.get("zoom_phone", 0)
+    pairings.update(code, data="Phone paired!", voter=None)
     return render_template("phone_paired.html", code=code)
 
 
 @app.route("/pair_phone/<code>/voter/")
 def phone_voter_html(code):
-    if (voter_id := phones[code].get("voter")) is None:
+    if (voter_id := (pairings.get(code) or {}).get("voter")) is None:
         abort(404)
-    voter = db.get_voter_by_id(voter_id)
+    voter = db.view_voter_by_id(voter_id)
     return render_template("phone_voter.html", voter=voter)
 
 
 @app.route("/pair_phone/<code>/status.json")
 def pair_phone_status(code):
-    if code not in phones:
+    if (phone := pairings.get(code)) is None or "data" not in phone:
         abort(404)
 
-    if "data" not in phones[code]:
+    return jsonify(**phone)
+
+
+@app.route("/pair_phone/<code>/wait")
+def pair_phone_wait(code):
+    version = request.args.get("version", -1, type=int)
+    try:
+        state = pairings.poll(code, version)
+    except TooManyWaiters:
+        return Response(status=503, headers={"Retry-After": str(RETRY_SECS)})
+
+    if state is None:
         abort(404)
 
-    return jsonify(**phones[code])
+    return jsonify(**state)
 
 
 @app.route("/activity_feed/")
@@ -961,10 +1078,31 @@ def activity_feed():
     return render_template("activity_feed.html", ns=ns)
 
 
+@app.route("/progress/")
+def progress():
+    restrict_admin()
+
+    tracker = get_progress()
+    turfs = [(t, tracker.get(t.id)) for t in db.turfs if t.visible and t.doors]
+
+    if request.args.get("format") == "json":
+        return jsonify([{"id": t.id, "desc": t.desc} | p.to_dict() for t, p in turfs])
+
+    return render_template("progress.html", turfs=turfs)
+
+
+@app.route("/cache_stats/")
+def cache_stats():
+    restrict_admin()
+
+    return jsonify(cache=cache.stats(), fragments=fragment_cache.stats())
+
+
 @app.route("/credits/")
 def credits():
     return render_template("credits.html")
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     app.run(host="0.0.0.0", port=3030, debug=True)
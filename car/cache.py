@@ -0,0 +1,235 @@
+"""Bounded key-value caches with per-key TTLs and LRU eviction.
+
+MemoryCache is private to the process. SQLiteCache keeps its entries in
+`cache.sqlite3` under $CAR_DATA_PATH, so every gunicorn worker sees the
+same ones; values have to be JSON-serializable. Pick one with $CAR_CACHE
+(`memory`, or `sqlite`; the default is `sqlite` when running more than one
+worker and `memory` otherwise) and bound it with $CAR_CACHE_MAX_SIZE.
+"""
+
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Any
+
+from .storage import DATA_ROOT, MULTIPROCESS
+
+CACHE_BACKEND = os.getenv("CAR_CACHE", "sqlite" if MULTIPROCESS else "memory")
+CACHE_MAX_SIZE = int(os.getenv("CAR_CACHE_MAX_SIZE", "100000"))
+
+
+class Cache:
+    def __init__(self, max_size: int = CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: float | None = None):
+        """Store `value` for `ttl` seconds (or until evicted)"""
+        raise NotImplementedError
+
+    def add(self, key: str, value: Any, ttl: float | None = None) -> bool:
+        """Store `value` only if `key` isn't already live. Returns whether it
+        was stored; atomic, so it can be used as a lock."""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def memoize(self, ttl: float | None = None):
+        """Decorator caching a function's results by its arguments' reprs"""
+
+        def decorator[**P, R](f: Callable[P, R]) -> Callable[P, R]:
+            prefix = f"{f.__module__}.{getattr(f, '__qualname__', repr(f))}"
+
+            @functools.wraps(f)
+            def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+                key = f"{prefix}:{args!r}:{kwargs!r}"
+                missing = object()
+                result = self.get(key, missing)
+                if result is missing:
+                    result = f(*args, **kwargs)
+                    self.set(key, result, ttl)
+
+                return result
+
+            return wrapper
+
+        return decorator
+
+
+class MemoryCache(Cache):
+    def __init__(self, max_size: int = CACHE_MAX_SIZE):
+        super().__init__(max_size)
+        # key -> (value, expiry), least recently used first
+        self.data: OrderedDict[str, tuple[Any, float | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live(self, key: str, now: float) -> bool:
+        if key not in self.data:
+            return False
+
+        _, expires = self.data[key]
+        if expires is not None and expires <= now:
+            del self.data[key]
+            self.expirations += 1
+            return False
+
+        return True
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            if not self._live(key, time.time()):
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self.data.move_to_end(key)
+            return self.data[key][0]
+
+    def _store(self, key: str, value: Any, ttl: float | None, now: float):
+        self.data[key] = (value, None if ttl is None else now + ttl)
+        self.data.move_to_end(key)
+        while len(self.data) > self.max_size:
+            self.data.popitem(last=False)
+            self.evictions += 1
+
+    def set(self, key: str, value: Any, ttl: float | None = None):
+        with self._lock:
+            self._store(key, value, ttl, time.time())
+
+    def add(self, key: str, value: Any, ttl: float | None = None) -> bool:
+        with self._lock:
+            now = time.time()
+            if self._live(key, now):
+                return False
+
+            self._store(key, value, ttl, now)
+            return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self.data.pop(key, None)
+
+
+class SQLiteCache(Cache):
+    # entries over max_size are trimmed every this many writes, rather than
+    # counting rows on each one
+    TRIM_EVERY = 100
+
+    def __init__(self, path: str | None = None, max_size: int = CACHE_MAX_SIZE):
+        super().__init__(max_size)
+        self.path = path or os.path.join(DATA_ROOT, "cache.sqlite3")
+        self._local = threading.local()
+        self._writes = 0
+
+        with self.conn as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL, expires REAL, used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_used ON cache(used)")
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # one connection per thread; sqlite does the cross-process locking
+        if not hasattr(self._local, "conn"):
+            self._local.conn = sqlite3.connect(self.path, timeout=10)
+            self._local.conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn.execute("PRAGMA synchronous=OFF")
+
+        return self._local.conn
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        with self.conn as conn:
+            row = conn.execute(
+                "SELECT value, expires FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is not None and row[1] is not None and row[1] <= now:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.expirations += 1
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return default
+
+            conn.execute("UPDATE cache SET used = ? WHERE key = ?", (now, key))
+
+        self.hits += 1
+        return json.loads(row[0])
+
+    def _wrote(self, conn: sqlite3.Connection):
+        self._writes += 1
+        if self._writes % self.TRIM_EVERY:
+            return
+
+        (size,) = conn.execute("SELECT count(*) FROM cache").fetchone()
+        if size > self.max_size:
+            conn.execute(
+                "DELETE FROM cache WHERE key IN"
+                " (SELECT key FROM cache ORDER BY used LIMIT ?)",
+                (size - self.max_size,),
+            )
+            self.evictions += size - self.max_size
+
+    def set(self, key: str, value: Any, ttl: float | None = None):
+        now = time.time()
+        with self.conn as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires, used)"
+                " VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), None if ttl is None else now + ttl, now),
+            )
+            self._wrote(conn)
+
+    def add(self, key: str, value: Any, ttl: float | None = None) -> bool:
+        now = time.time()
+        with self.conn as conn:
+            cursor = conn.execute(
+                "INSERT INTO cache (key, value, expires, used) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET value = excluded.value,"
+                " expires = excluded.expires, used = excluded.used"
+                " WHERE cache.expires IS NOT NULL AND cache.expires <= ?",
+                (key, json.dumps(value), None if ttl is None else now + ttl, now, now),
+            )
+            self._wrote(conn)
+
+        return cursor.rowcount > 0
+
+    def delete(self, key: str):
+        with self.conn as conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+
+BACKENDS: dict[str, type[Cache]] = {
+    "memory": MemoryCache,
+    "sqlite": SQLiteCache,
+}
+
+
+@functools.cache
+def get_cache() -> Cache:
+    return BACKENDS[CACHE_BACKEND]()
@@ -0,0 +1,156 @@
+"""Compact, column-oriented storage for large record collections.
+
+A ColumnStore keeps one column per model field instead of one pydantic
+object per record: optional floats and ints live in packed arrays, fields
+listed in the model's COMPACT_INTERNED are stored as small integer codes
+into a table of distinct values, and everything else in plain lists.
+Records are materialized with `model_construct` when they're indexed, so
+changes to a materialized record only stick once it's assigned back
+(`_save_model` does this).
+"""
+
+import math
+import sys
+import types
+from array import array
+from collections.abc import Iterable, Iterator, MutableSequence
+from typing import Any, Union, get_args, get_origin, overload
+
+from pydantic import BaseModel
+
+_NO_INT = -(2**63)
+
+
+def _optional_of(annotation: Any) -> Any:
+    """X for `X | None`, else None"""
+    if get_origin(annotation) in (Union, types.UnionType):
+        # unwrap `type` aliases like ID
+        args = [
+            getattr(a, "__value__", a)
+            for a in get_args(annotation)
+            if a is not type(None)
+        ]
+        if len(args) == 1 and len(get_args(annotation)) == 2:
+            return args[0]
+
+    return None
+
+
+class _Interned:
+    __slots__ = ("codes", "values", "lookup")
+
+    def __init__(self):
+        self.codes = array("I")
+        self.values: list[Any] = []
+        self.lookup: dict[Any, int] = {}
+
+    def encode(self, value: Any) -> int:
+        try:
+            return self.lookup[value]
+        except KeyError:
+            self.lookup[value] = len(self.values)
+            self.values.append(value)
+            return self.lookup[value]
+
+
+class ColumnStore[T: BaseModel](MutableSequence[T]):
+    def __init__(self, model: type[T], items: Iterable[T] = ()):
+        self.model = model
+        self.fields = [name for name in model.model_fields if name != "id_"]
+        self.columns: dict[str, Any] = {}
+
+        interned = getattr(model, "COMPACT_INTERNED", ())
+        for name in self.fields:
+            annotation = model.model_fields[name].annotation
+            if name in interned:
+                self.columns[name] = _Interned()
+            elif _optional_of(annotation) is float:
+                self.columns[name] = array("d")
+            elif _optional_of(annotation) is int:
+                self.columns[name] = array("q")
+            else:
+                self.columns[name] = []
+
+        self._len = 0
+        for item in items:
+            self.append(item)
+
+    def _encode(self, name: str, value: Any) -> Any:
+        column = self.columns[name]
+        if isinstance(column, _Interned):
+            return column.encode(value)
+        if isinstance(column, array) and column.typecode == "d":
+            return math.nan if value is None else value
+        if isinstance(column, array):
+            return _NO_INT if value is None else value
+        if isinstance(value, str):
+            return sys.intern(value)
+        return value
+
+    def _decode(self, name: str, idx: int) -> Any:
+        column = self.columns[name]
+        if isinstance(column, _Interned):
+            return column.values[column.codes[idx]]
+
+        value = column[idx]
+        if isinstance(column, array) and column.typecode == "d":
+            return None if math.isnan(value) else value
+        if isinstance(column, array):
+            return None if value == _NO_INT else value
+        return value
+
+    def _target(self, name: str) -> Any:
+        column = self.columns[name]
+        return column.codes if isinstance(column, _Interned) else column
+
+    def _index(self, idx: int) -> int:
+        if idx < 0:
+            idx += self._len
+        if not 0 <= idx < self._len:
+            raise IndexError("ColumnStore index out of range")
+        return idx
+
+    def _materialize(self, idx: int) -> T:
+        values = {name: self._decode(name, idx) for name in self.fields}
+        return self.model.model_construct(
+            _fields_set={"id_", *self.fields}, id_=idx, **values
+        )
+
+    @overload
+    def __getitem__(self, idx: int) -> T: ...
+
+    @overload
+    def __getitem__(self, idx: slice) -> list[T]: ...
+
+    def __getitem__(self, idx: int | slice) -> T | list[T]:
+        if isinstance(idx, slice):
+            return [self._materialize(i) for i in range(*idx.indices(self._len))]
+
+        return self._materialize(self._index(idx))
+
+    def __setitem__(self, idx, value):
+        if isinstance(idx, slice):
+            raise TypeError("ColumnStore doesn't support slice assignment")
+
+        idx = self._index(idx)
+        for name in self.fields:
+            self._target(name)[idx] = self._encode(name, getattr(value, name))
+
+    def __delitem__(self, idx):
+        raise TypeError("records can't be deleted")
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[T]:
+        for idx in range(self._len):
+            yield self._materialize(idx)
+
+    def insert(self, index: int, value: T):
+        if index < self._len:
+            raise TypeError("records can only be appended")
+
+        for name in self.fields:
+            self._target(name).append(self._encode(name, getattr(value, name)))
+
+        self._len += 1
@@ -1,43 +1,32 @@
-import collections
-import functools
+from .model import ID, Database, Voter, normalize_phone
 
 phone_keys = ["cellphone", "landlinephone", "bestphone"]
 
 
-@functools.cache
-def phone_households():
-    from .app import db
-
-    result = collections.defaultdict(list)
-    for phone_key in phone_keys:
-        for voter in db.voters:
-            phone = getattr(voter, phone_key)
-            if not phone:
-                continue
-
-            if voter not in result[phone]:
-                result[phone].append(voter)
-
-    return result
-
-
-def household_info_by_phones(voter):
-    result = collections.defaultdict(list)
+def household_ids_by_phones(voter: Voter) -> dict[str, list[ID]]:
+    """IDs of the other voters sharing each of `voter`'s phone numbers (as
+    written on `voter`), from the database's voter_phone index"""
+    db = Database.get()
+    result = {}
     seen = set()
 
-    households = phone_households()
-
     for phone_key in phone_keys:
         phone = getattr(voter, phone_key)
+        number = normalize_phone(phone) if phone else None
 
-        if phone in seen:
+        if number is None or number in seen:
             continue
-        seen.add(phone)
-
-        for other_voter in households[phone]:
-            if other_voter.id == voter.id:
-                continue
+        seen.add(number)
 
-            result[phone].append(other_voter)
+        if other_ids := sorted(db.lookup_all("voter_phone", number) - {voter.id}):
+            result[phone] = other_ids
 
     return result
+
+
+def household_info_by_phones(voter: Voter) -> dict[str, list[Voter]]:
+    db = Database.get()
+    return {
+        phone: [db.view_voter_by_id(id) for id in ids]
+        for phone, ids in household_ids_by_phones(voter).items()
+    }
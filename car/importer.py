@@ -0,0 +1,266 @@
+"""Streaming imports of vendor voter files.
+
+A VoterFile reads its CSV a row at a time; subclasses (in the import_*
+scripts) say how a vendor's columns map onto doors and voters.
+import_voter_file finds or creates each row's door through a dict keyed on
+(address, unit, city), adds records through Database.bulk_append, and prints
+progress with a rows/s rate as it goes. Nothing holds on to rows, so memory
+use is the database being built, however big the file.
+
+merge_voter_file instead upserts a file into a live database, keeping ids
+(and so turfs and notes) for voters and doors it already has.
+"""
+
+import csv
+import time
+from collections import Counter
+from collections.abc import Iterator
+
+from .model import ID, Database, Door, Note, NoteDatabase, Voter, normalize_address
+
+type Row = dict[str, str]
+# (address, unit, city)
+type DoorKey = tuple[str, str, str]
+
+PROGRESS_EVERY = 100_000
+
+# author of the notes a merge leaves on the voters it changes
+IMPORT_AUTHOR = "voter import"
+REMOVED_NOTE = "not in the latest voter file"
+RETURNED_NOTE = "back in the voter file"
+
+
+class Progress:
+    """Prints a running count and rate every `every` rows"""
+
+    def __init__(self, label: str, every: int = PROGRESS_EVERY):
+        self.label = label
+        self.every = every
+        self.count = 0
+        self.started = time.perf_counter()
+
+    def tick(self):
+        self.count += 1
+        if self.count % self.every == 0:
+            self.report()
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        rate = self.count / elapsed if elapsed else 0.0
+        print(f"{self.label}: {self.count:,} rows, {rate:,.0f} rows/s")
+
+
+class VoterFile:
+    def __init__(self, path: str):
+        self.path = path
+
+    def rows(self) -> Iterator[Row]:
+        with open(self.path, newline="") as f:
+            yield from csv.DictReader(f)
+
+    def include(self, row: Row) -> bool:
+        return True
+
+    def door_key(self, row: Row) -> DoorKey:
+        raise NotImplementedError
+
+    def door(self, row: Row, key: DoorKey) -> Door:
+        address, unit, city = key
+        return Door(address=address, unit=unit, city=city, created_by="voter import")
+
+    def voter(self, row: Row, door_id: ID) -> Voter:
+        raise NotImplementedError
+
+    def imported(self, row: Row, voter: Voter):
+        """Called with each row once its voter is in the database"""
+
+    def finish(self):
+        """Called after the last row"""
+
+
+def import_voter_file(
+    db: Database, source: VoterFile, every: int = PROGRESS_EVERY
+) -> Counter[str]:
+    """Add every included row of `source` to `db` as a voter, at a new or
+    existing door. Returns counts of rows, skipped rows, doors and voters."""
+    stats: Counter[str] = Counter()
+    door_ids: dict[DoorKey, ID] = {(d.address, d.unit, d.city): d.id for d in db.doors}
+    progress = Progress(source.path, every)
+
+    with db.bulk_append() as append:
+        for row in source.rows():
+            progress.tick()
+            if not source.include(row):
+                stats["skipped"] += 1
+                continue
+
+            key = source.door_key(row)
+            if (door_id := door_ids.get(key)) is None:
+                door_id = door_ids[key] = append(source.door(row, key))
+                stats["doors"] += 1
+
+            voter = source.voter(row, door_id)
+            append(voter)
+            stats["voters"] += 1
+            source.imported(row, voter)
+
+    source.finish()
+    progress.report()
+    stats["rows"] = progress.count
+    return stats
+
+
+def _describe(door: Door) -> str:
+    return " ".join(filter(None, (door.address, door.unit, door.city)))
+
+
+def _flagged_removed(notes: NoteDatabase, voter: Voter) -> bool:
+    # (not by_type_and_id, which would add an empty list for every voter)
+    for note in notes.voter.get(voter.id_for_notes(), ()):
+        if note.author == IMPORT_AUTHOR and note.note in (REMOVED_NOTE, RETURNED_NOTE):
+            return note.note == REMOVED_NOTE
+
+    return False
+
+
+def merge_voter_file(
+    db: Database, source: VoterFile, every: int = PROGRESS_EVERY
+) -> Counter[str]:
+    """Upsert `source` into `db`: voters are matched by statevoterid and doors
+    by normalized (address, unit, city). Matched voters get the file's values
+    (and a note saying what changed), matched doors get the fields they were
+    missing, unmatched rows are added, and voters with a statevoterid that
+    aren't in the file get a note saying so (once). Merging the same file
+    again changes nothing. Returns counts of what it did, including
+    "changed <field>" for each voter field."""
+    stats: Counter[str] = Counter()
+    notes = NoteDatabase.get()
+    progress = Progress(source.path, every)
+
+    # hash joins against the database's own indexes, plus what this merge adds
+    door_ids: dict[DoorKey, ID] = {}
+    new_doors: dict[DoorKey, ID] = {}
+    seen_voters: set[str] = set()
+    checked_doors: set[ID] = set()
+
+    def find_door(row: Row) -> ID:
+        key = source.door_key(row)
+        if (door_id := door_ids.get(key)) is not None:
+            return door_id
+
+        normalized = (
+            normalize_address(key[0]),
+            normalize_address(key[1]),
+            normalize_address(key[2]),
+        )
+        door_id = db.lookup("door_normalized_address", normalized)
+        if door_id is None:
+            door_id = new_doors.get(normalized)
+
+        if door_id is None:
+            door_id = new_doors[normalized] = append(source.door(row, key))
+            checked_doors.add(door_id)
+            stats["doors added"] += 1
+
+        elif door_id not in checked_doors:
+            # only fill in blanks; addresses stay as they are, since door notes
+            # are keyed on them, and so do coordinates from geocoding
+            checked_doors.add(door_id)
+            existing = db.doors[door_id]
+            door = source.door(row, key)
+            fill = {
+                field: value
+                for field in door.model_fields_set
+                - {"address", "unit", "city", "created_by"}
+                if (value := getattr(door, field)) not in (None, "", [])
+                and getattr(existing, field) in (None, "")
+            }
+            if fill:
+                db.save_door(db.get_door_by_id(door_id).model_copy(update=fill))
+                stats["doors updated"] += 1
+
+        door_ids[key] = door_id
+        return door_id
+
+    with db.bulk_append() as append:
+        for row in source.rows():
+            progress.tick()
+            if not source.include(row):
+                stats["skipped"] += 1
+                continue
+
+            door_id = find_door(row)
+            voter = source.voter(row, door_id)
+            if not voter.statevoterid or voter.statevoterid in seen_voters:
+                # nothing to match it on next time, or already merged
+                stats["skipped"] += 1
+                continue
+
+            seen_voters.add(voter.statevoterid)
+            voter_id = db.lookup("voter_statevoterid", voter.statevoterid)
+            if voter_id is None:
+                append(voter)
+                stats["voters added"] += 1
+                source.imported(row, voter)
+                continue
+
+            existing = db.voters[voter_id]
+            diffs = {
+                field: (old, new)
+                for field in voter.model_fields_set - {"created_by", "door_id"}
+                if (old := getattr(existing, field)) != (new := getattr(voter, field))
+            }
+            messages = [
+                f"changed {field} from {old!r} to {new!r}."
+                for field, (old, new) in diffs.items()
+            ]
+            if existing.door_id != door_id:
+                diffs["door_id"] = (existing.door_id, door_id)
+                old_door = "no door"
+                if existing.door_id is not None:
+                    old_door = _describe(db.doors[existing.door_id])
+                messages.append(
+                    f"moved from {old_door} to {_describe(db.doors[door_id])}."
+                )
+
+            updated = existing
+            if diffs:
+                updated = db.save_voter(
+                    db.get_voter_by_id(voter_id).model_copy(
+                        update={field: new for field, (_, new) in diffs.items()}
+                    )
+                )
+                updated.add_note(
+                    Note(
+                        author=IMPORT_AUTHOR,
+                        system=True,
+                        note=" ".join(messages),
+                        diffs=diffs,
+                    )
+                )
+                stats["voters moved" if "door_id" in diffs else "voters updated"] += 1
+                stats.update(f"changed {field}" for field in diffs)
+            else:
+                stats["voters unchanged"] += 1
+
+            if _flagged_removed(notes, existing):
+                updated.add_note(
+                    Note(author=IMPORT_AUTHOR, system=True, note=RETURNED_NOTE)
+                )
+                stats["voters returned"] += 1
+
+            source.imported(row, voter)
+
+    for voter in db.voters:
+        if (
+            voter.statevoterid
+            and voter.statevoterid not in seen_voters
+            and not _flagged_removed(notes, voter)
+        ):
+            voter.add_note(Note(author=IMPORT_AUTHOR, system=True, note=REMOVED_NOTE))
+            stats["voters removed"] += 1
+
+    source.finish()
+    progress.report()
+    stats["rows"] = progress.count
+    return stats
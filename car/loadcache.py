@@ -0,0 +1,161 @@
+"""A binary cache of each JSON database, so a restart doesn't have to
+validate the whole file again.
+
+`<name>.cache` next to `<name>.json` holds every record's field values as
+plain tuples, and the database's secondary indexes, pickled, along with a
+hash of the JSON file it was built from and of the code defining the models
+(and so the index keys). Loading it builds the models directly, without
+validation or reindexing, and is only done when both hashes match. It's written at every
+checkpoint and whenever the JSON had to be validated. Turn it off with
+CAR_LOAD_CACHE=0.
+
+Like the JSON files, the cache is trusted: anyone who can write to the data
+directory can run code in the app through it.
+"""
+
+import contextlib
+import functools
+import gc
+import hashlib
+import os
+import pickle
+import sys
+from collections import defaultdict
+from collections.abc import Generator
+from typing import TYPE_CHECKING, Any, get_args, get_origin
+
+from pydantic import BaseModel
+
+if TYPE_CHECKING:
+    from .model import BaseDatabase
+
+LOAD_CACHE = os.getenv("CAR_LOAD_CACHE", "1") != "0"
+
+# bump if the layout below changes
+FORMAT = 1
+
+
+@contextlib.contextmanager
+def paused_gc() -> Generator[None, None, None]:
+    """Building hundreds of thousands of objects at once otherwise sets off
+    the cyclic GC over and over, for nothing"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _item_model(annotation: Any) -> type[BaseModel] | None:
+    """The model in list[Model] or dict[str, list[Model]], if any"""
+    match get_origin(annotation), get_args(annotation):
+        case (origin, (item,)) if origin is list:
+            if isinstance(item, type) and issubclass(item, BaseModel):
+                return item
+        case (origin, (_, value)) if origin in (dict, defaultdict):
+            return _item_model(value)
+
+    return None
+
+
+@functools.cache
+def _schema(cls: type["BaseDatabase"]) -> str:
+    fields = []
+    for name, field in cls.model_fields.items():
+        model = _item_model(field.annotation)
+        fields.append(
+            (name, str(field.annotation), model and tuple(model.model_fields))
+        )
+
+    with open(sys.modules[cls.__module__].__file__ or "", "rb") as f:
+        source = f.read()
+
+    return digest(repr((FORMAT, cls.__name__, fields, source)).encode())
+
+
+def cache_file(cls: type["BaseDatabase"]) -> str:
+    return cls.db_file().removesuffix(".json") + ".cache"
+
+
+def _rows(models: Any, keys: tuple[str, ...]) -> list[tuple]:
+    return [tuple(m.__dict__[k] for k in keys) for m in models]
+
+
+def _build(model: type[BaseModel], rows: list[tuple]) -> list[BaseModel]:
+    # what validation would have left behind; every field is in the fields
+    # set already, so one set can be shared by all of them
+    keys = tuple(model.model_fields)
+    fields_set = set(keys)
+    new = model.__new__
+    setattr_ = object.__setattr__
+    result = []
+    for row in rows:
+        m = new(model)
+        setattr_(m, "__dict__", dict(zip(keys, row, strict=True)))
+        setattr_(m, "__pydantic_fields_set__", fields_set)
+        setattr_(m, "__pydantic_extra__", None)
+        setattr_(m, "__pydantic_private__", None)
+        result.append(m)
+
+    return result
+
+
+def write(db: "BaseDatabase", source_digest: str):
+    cls = type(db)
+    payload: dict[str, Any] = {}
+    for name, field in cls.model_fields.items():
+        value = getattr(db, name)
+        if (model := _item_model(field.annotation)) is None:
+            payload[name] = value
+        elif get_origin(field.annotation) is list:
+            payload[name] = _rows(value, tuple(model.model_fields))
+        else:
+            keys = tuple(model.model_fields)
+            payload[name] = {k: _rows(v, keys) for k, v in value.items()}
+
+    path = cache_file(cls)
+    with open(f"{path}.{os.getpid()}", "wb") as f:
+        pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+        # no memo, so lists shared between records in memory (say, after a
+        # model_copy) come back separate, as they would from the JSON
+        pickler.fast = True
+        pickler.dump((_schema(cls), source_digest, payload, db.index_state()))
+
+    os.replace(f"{path}.{os.getpid()}", path)
+
+
+def read[D: BaseDatabase](cls: type[D], source_digest: str) -> D | None:
+    """The database cached from the JSON with `source_digest`, if there is
+    one and it's for the current models"""
+    try:
+        with open(cache_file(cls), "rb") as f:
+            schema, cached_digest, payload, index_state = pickle.load(f)
+    except Exception:
+        # missing, torn, or from some other version; it gets rewritten
+        return None
+
+    if (schema, cached_digest) != (_schema(cls), source_digest):
+        return None
+
+    values: dict[str, Any] = {}
+    for name, field in cls.model_fields.items():
+        value = payload[name]
+        if (model := _item_model(field.annotation)) is None:
+            values[name] = value
+        elif get_origin(field.annotation) is list:
+            values[name] = _build(model, value)
+        else:
+            notes = {k: _build(model, v) for k, v in value.items()}
+            if get_origin(field.annotation) is defaultdict:
+                notes = defaultdict(list, notes)
+            values[name] = notes
+
+    db = cls.model_construct(**values)
+    db.set_index_state(index_state)
+    return db
@@ -1,13 +1,38 @@
+import contextlib
 import functools
+import logging
 import os
+import re
+import time
+import uuid
 from collections import defaultdict
-from collections.abc import Mapping, Sequence
+from collections.abc import (
+    Callable,
+    Generator,
+    Hashable,
+    Iterable,
+    Iterator,
+    Mapping,
+    Sequence,
+)
 from datetime import datetime
 from typing import Any, ClassVar, Literal, Self, cast
 
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, field_serializer
 from typing_extensions import TypeIs
 
+from . import startup
+from .columns import ColumnStore
+from .storage import (
+    DATA_ROOT,
+    DATABASES,
+    WRITE_LOCK,
+    get_coordinator,
+    get_storage,
+)
+
+logger = logging.getLogger(__name__)
+
 type ID = int
 type NotesKey = str
 type Disposition = Literal[
@@ -20,7 +45,6 @@ type Disposition = Literal[
     None,
 ]
 
-DATA_ROOT = os.getenv("CAR_DATA_PATH", ".")
 
 DISPOSITIONS: dict[str | None, str] = {
     None: "-",
@@ -42,12 +66,66 @@ def is_valid_disposition(x: str | None) -> TypeIs[Disposition]:
     return x in DISPOSITIONS
 
 
+@functools.lru_cache(maxsize=2**16)
+def normalize_phone(phone: str) -> int | None:
+    """A US phone number as its 10 digits (without a leading 1), or None if it
+    doesn't look like one"""
+    digits = "".join(c for c in phone if c.isdigit())
+    if len(digits) == 11 and digits[0] == "1":
+        digits = digits[1:]
+
+    return int(digits) if len(digits) == 10 else None
+
+
+ADDRESS_ABBREVIATIONS = {
+    "NORTH": "N",
+    "SOUTH": "S",
+    "EAST": "E",
+    "WEST": "W",
+    "NORTHEAST": "NE",
+    "NORTHWEST": "NW",
+    "SOUTHEAST": "SE",
+    "SOUTHWEST": "SW",
+    "STREET": "ST",
+    "AVENUE": "AVE",
+    "AV": "AVE",
+    "ROAD": "RD",
+    "DRIVE": "DR",
+    "LANE": "LN",
+    "COURT": "CT",
+    "CIRCLE": "CIR",
+    "PLACE": "PL",
+    "BOULEVARD": "BLVD",
+    "PARKWAY": "PKWY",
+    "HIGHWAY": "HWY",
+    "TERRACE": "TER",
+    "TRAIL": "TRL",
+    "APARTMENT": "APT",
+    "SUITE": "STE",
+    "UNIT": "APT",
+    "#": "APT",
+}
+
+
+def normalize_address(address: str) -> str:
+    """Uppercase, punctuation dropped and common words abbreviated, so
+    "123 North Main Street" and "123 N. MAIN ST" come out the same"""
+    words = [
+        ADDRESS_ABBREVIATIONS.get(w, w) for w in re.findall(r"\w+|#", address.upper())
+    ]
+    # "APT #4" -> "APT APT 4" -> "APT 4"
+    return " ".join(w for i, w in enumerate(words) if i == 0 or words[i - 1] != w)
+
+
 def timestamp() -> str:
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
 
 type DatabaseType = Literal["turf", "door", "voter", "group"]
 
+# keep voters and doors in column-oriented storage (see car.columns)
+COMPACT = bool(os.getenv("CAR_COMPACT"))
+
 
 def is_valid_type(typ: str) -> TypeIs[DatabaseType]:
     return typ in {"turf", "door", "voter", "group"}
@@ -56,14 +134,47 @@ def is_valid_type(typ: str) -> TypeIs[DatabaseType]:
 class BaseDatabase(BaseModel):
     DATABASE_FILE_NAME: ClassVar[str]
     SHOULD_CREATE: ClassVar[bool] = False
+    JOURNALED: ClassVar[bool] = False
+    # record collection -> fields the sqlite engine indexes
+    INDEXED_FIELDS: ClassVar[dict[str, tuple[str, ...]]] = {}
     _INSTANCE: ClassVar[Self]
 
+    # sequence number of the last journal entry written (in the base file:
+    # the last one folded into it)
+    journal_seq: int = 0
+    # set at the first checkpoint of a database built from scratch (by an
+    # import or a restore) and kept from then on; journal entries carry it,
+    # and are never applied to another generation, where their ids may mean
+    # other records
+    generation: str = ""
+
+    _journal: list[dict[str, Any]] = PrivateAttr(default_factory=list)
+    _journal_len: int = PrivateAttr(default=0)
+    _checkpointed_at: float = PrivateAttr(default_factory=time.time)
+    _listeners: list[Callable[[dict[str, Any]], None]] = PrivateAttr(
+        default_factory=list
+    )
+    # (collection or note type, id) -> value of _version_clock at its last change
+    _versions: dict[Hashable, int] = PrivateAttr(default_factory=dict)
+    _version_clock: int = PrivateAttr(default=0)
+    _reset_version: int = PrivateAttr(default=0)
+
     def assert_constraints(self):
         pass
 
     def fixup_backrefs(self):
         pass
 
+    def rebuild_indexes(self):
+        pass
+
+    def index_state(self) -> Any:
+        """Indexes built by rebuild_indexes, for the load cache to keep"""
+        return None
+
+    def set_index_state(self, state: Any):
+        pass
+
     @classmethod
     def db_file(cls):
         return os.path.join(DATA_ROOT, f"{cls.DATABASE_FILE_NAME}.json")
@@ -73,48 +184,136 @@ class BaseDatabase(BaseModel):
         return os.path.join(DATA_ROOT, f"{cls.DATABASE_FILE_NAME}-new.json")
 
     @classmethod
-    def db_commit_file(cls):
-        return os.path.join(
-            DATA_ROOT,
-            f"snapshot/{cls.DATABASE_FILE_NAME}-{datetime.now().isoformat()}.json",
-        )
+    def db_journal_file(cls):
+        return os.path.join(DATA_ROOT, f"{cls.DATABASE_FILE_NAME}.log")
 
     def to_json(self):
         return self.model_dump_json(indent=4, by_alias=True)
 
-    def commit(self, backup: bool = True):
-        self.assert_constraints()
-        self.fixup_backrefs()
+    def record(self, entry: dict[str, Any]):
+        """Queue a journal entry to be appended on the next commit (which
+        numbers it, under WRITE_LOCK, so it can't take another process's
+        number while it waits)"""
+        self._journal.append(entry | {"gen": self.generation})
+
+    def apply(self, entry: dict[str, Any]):
+        """Replay a journal entry written by `record`"""
+        raise NotImplementedError
+
+    def subscribe(self, listener: Callable[[dict[str, Any]], None]):
+        """Call `listener` with a journal-style entry after every change to
+        this database. Record saves pass only the collection and id; a
+        `{"op": "reset"}` means anything may have changed."""
+        self._listeners.append(listener)
+
+    def notify(self, entry: dict[str, Any]):
+        self._version_clock += 1
+        match entry:
+            case {"op": "put", "collection": name, "id": id}:
+                self._versions[name, id] = self._version_clock
+            case {"op": "note", "typ": typ, "id": id}:
+                self._versions[typ, id] = self._version_clock
+            case {"op": "reset"}:
+                self._reset_version = self._version_clock
+
+        for listener in self._listeners:
+            listener(entry)
+
+    def version(self, name: str, id: Hashable) -> int:
+        """A number that goes up whenever the record (`collection`, `id`) or
+        the notes (`type`, `id`) change. Only meaningful within this process."""
+        return self.versions([(name, id)])[0]
+
+    def versions(self, keys: Iterable[tuple[str, Hashable]]) -> list[int]:
+        """`version` of each of `keys`, in bulk"""
+        versions, floor = self._versions, self._reset_version
+        return [max(versions.get(key, 0), floor) for key in keys]
 
-        with open(self.db_temp_file(), "w") as f:
-            f.write(self.to_json())
+    def commit(self, backup: bool = True):
+        get_coordinator().submit(self, backup)
 
-        if backup:
-            if not os.path.isdir(os.path.join(DATA_ROOT, "snapshot")):
-                os.mkdir(os.path.join(DATA_ROOT, "snapshot"))
+    def flush(self, backup: bool = True):
+        """Write out this database's pending changes (called by the coordinator)"""
+        if not self.JOURNALED:
+            self.checkpoint(backup)
+            return
 
-            os.rename(self.db_file(), self.db_commit_file())
+        get_storage().commit(self, backup)
 
-        os.rename(self.db_temp_file(), self.db_file())
+    def checkpoint(self, backup: bool = True):
+        """Persist the whole database, folding in (and then dropping) the journal"""
+        self.assert_constraints()
+        self.fixup_backrefs()
+        if not self.generation:
+            self.generation = uuid.uuid4().hex
+        get_storage().checkpoint(self, backup)
+
+    def has_pending_changes(self) -> bool:
+        return bool(self._journal)
+
+    def has_new_records(self) -> bool:
+        """Whether records were added that aren't written out yet"""
+        return False
+
+    def reload(self, fresh: Self | None = None):
+        """Replace this database's contents with what's in storage (or with
+        `fresh`, already loaded from it), in place, so everything holding on
+        to it (listeners included) carries on. Changes not written out yet
+        are redone on top of it and stay queued, unless it's another
+        generation, in which case they're dropped with a warning."""
+        if fresh is None:
+            fresh = self._load()
+
+        pending = self._pending_entries()
+        for name in type(self).model_fields:
+            self.__dict__[name] = fresh.__dict__[name]
+        self._journal.clear()
+        self._journal_len = fresh._journal_len
+        self._checkpointed_at = fresh._checkpointed_at
+        self._reloaded(fresh)
+        self.notify({"op": "reset"})
+
+        if lost := sum(entry["gen"] != self.generation for entry in pending):
+            logger.warning(
+                "%s was replaced; dropped %d unsaved changes",
+                self.DATABASE_FILE_NAME,
+                lost,
+            )
+
+        redo = [entry for entry in pending if entry["gen"] == self.generation]
+        for entry in redo:
+            self.apply(entry)
+        self._journal.extend(redo)
+
+    def _pending_entries(self) -> list[dict[str, Any]]:
+        """Journal entries for everything not written out yet"""
+        return list(self._journal)
+
+    def _reloaded(self, fresh: Self):
+        pass
 
     @classmethod
     def get(cls) -> Self:
         try:
             return cls._INSTANCE
         except AttributeError:
-            cls._INSTANCE = cls._load()
+            # under the lock, so other workers can't commit halfway through
+            with WRITE_LOCK:
+                cls._INSTANCE = cls._load()
+                DATABASES[cls.DATABASE_FILE_NAME] = cls._INSTANCE
             return cls._INSTANCE
 
+    @classmethod
+    def _read(cls) -> tuple[Self, Any]:
+        """Load from storage, along with the sync state to adopt if it's used"""
+        with startup.timed(f"load {cls.DATABASE_FILE_NAME}"):
+            return get_storage().read(cls)
+
     @classmethod
     def _load(cls) -> Self:
-        file = cls.db_file()
-        if cls.SHOULD_CREATE and not os.path.exists(file):
-            empty = "{}"
-            with open(file, "w") as f:
-                f.write(empty)
-            return cls.model_validate_json(empty)
-        with open(cls.db_file()) as f:
-            return cls.model_validate_json(f.read())
+        db, state = cls._read()
+        get_storage().adopt(cls, state)
+        return db
 
     def __hash__(self):
         return hash(self.DATABASE_FILE_NAME)
@@ -137,21 +336,90 @@ class Note(BaseModel):
         )
 
 
+class LatestNotes:
+    """The newest (by ts) disposition notes under one notes key: overall, among
+    refusals, and per disposition. On ts ties the earlier-added note wins, like
+    a stable sort of the newest-first note list would give."""
+
+    __slots__ = ("any", "refusal", "by_disposition")
+
+    def __init__(self):
+        self.any: Note | None = None
+        self.refusal: Note | None = None
+        self.by_disposition: dict[Disposition, Note] = {}
+
+    def add(self, note: Note):
+        if note.disposition is None:
+            return
+
+        if self.any is None or note.ts > self.any.ts:
+            self.any = note
+
+        if note.has_refusal_disposition() and (
+            self.refusal is None or note.ts > self.refusal.ts
+        ):
+            self.refusal = note
+
+        latest = self.by_disposition.get(note.disposition)
+        if latest is None or note.ts > latest.ts:
+            self.by_disposition[note.disposition] = note
+
+
 class NoteDatabase(BaseDatabase):
     DATABASE_FILE_NAME: ClassVar[str] = "note-database"
     SHOULD_CREATE: ClassVar[bool] = True
+    JOURNALED: ClassVar[bool] = True
 
     turf: defaultdict[str, list[Note]] = defaultdict(list)
     door: defaultdict[str, list[Note]] = defaultdict(list)
     voter: defaultdict[str, list[Note]] = defaultdict(list)
 
+    # (type, notes key) -> latest notes; built on first use, then updated by
+    # add and apply
+    _latest: dict[tuple[str, NotesKey], LatestNotes] | None = PrivateAttr(default=None)
+
     def by_type_and_id(self, typ: DatabaseType, id: NotesKey) -> Sequence[Note]:
         """We explicitly return a Sequence instead of a list
         for immutability without copying to a tuple"""
         return getattr(self, typ)[id]
 
+    def latest(self, typ: DatabaseType, id: NotesKey) -> LatestNotes:
+        if self._latest is None:
+            self._latest = {}
+            for t in ("turf", "door", "voter"):
+                for key, notes in getattr(self, t).items():
+                    latest = self._latest[t, key] = LatestNotes()
+                    for note in reversed(notes):
+                        latest.add(note)
+
+        return self._latest.get((typ, id)) or LatestNotes()
+
+    def _reloaded(self, fresh: Self):
+        self._latest = None
+
+    def _add_latest(self, typ: str, id: NotesKey, note: Note):
+        if self._latest is not None:
+            self._latest.setdefault((typ, id), LatestNotes()).add(note)
+
     def add(self, typ: DatabaseType, id: NotesKey, note: Note):
-        getattr(self, typ)[id].insert(0, note)
+        with WRITE_LOCK:
+            getattr(self, typ)[id].insert(0, note)
+            self._add_latest(typ, id, note)
+            self.record(
+                {
+                    "op": "note",
+                    "typ": typ,
+                    "id": id,
+                    "note": note.model_dump(mode="json"),
+                }
+            )
+            self.notify({"op": "note", "typ": typ, "id": id, "note": note})
+
+    def apply(self, entry: dict[str, Any]):
+        note = Note.model_validate(entry["note"])
+        getattr(self, entry["typ"])[entry["id"]].insert(0, note)
+        self._add_latest(entry["typ"], entry["id"], note)
+        self.notify(entry | {"note": note})
 
 
 class Model(BaseModel):
@@ -177,13 +445,14 @@ class Model(BaseModel):
     def last_disposition_with_note(
         self, after: str | None = None, default: Disposition = None
     ) -> tuple[Disposition, Note | None]:
-        notes = [n for n in self.notes if n.disposition is not None]
-        notes.sort(key=lambda k: k.ts)
-        if after is not None:
-            notes = [n for n in notes if (n.ts > after or n.has_refusal_disposition())]
+        latest = NoteDatabase.get().latest(self.TYPE, self.id_for_notes())
+        note = latest.any
+        if after is not None and note is not None and note.ts <= after:
+            # only refusals count from before `after`
+            note = latest.refusal
 
-        if notes:
-            return notes[-1].disposition, notes[-1]
+        if note is not None:
+            return note.disposition, note
 
         return default, None
 
@@ -196,6 +465,13 @@ class Model(BaseModel):
     def to_dict(self):
         return self.model_dump(by_alias=True)
 
+    def version(self) -> tuple[int, int]:
+        """Versions of this record and of its notes (see BaseDatabase.version)"""
+        return (
+            Database.get().version(f"{self.TYPE}s", self.id),
+            NoteDatabase.get().version(self.TYPE, self.id_for_notes()),
+        )
+
     @property
     def notes(self) -> Sequence[Note]:
         return NoteDatabase.get().by_type_and_id(self.TYPE, self.id_for_notes())
@@ -230,13 +506,14 @@ class Turf(Model):
     visible: bool = True
 
     def started_at(self) -> str | None:
-        for note in sorted(self.notes, key=lambda k: k.ts, reverse=True):
-            if note.disposition == "in-progress":
-                return note.ts
+        latest = NoteDatabase.get().latest(self.TYPE, self.id_for_notes())
+        if note := latest.by_disposition.get("in-progress"):
+            return note.ts
 
 
 class Door(Model):
     TYPE: ClassVar[DatabaseType] = "door"
+    COMPACT_INTERNED: ClassVar[tuple[str, ...]] = ("city", "created_by")
 
     address: str = ""
     unit: str = ""
@@ -266,6 +543,13 @@ class Door(Model):
     def id_for_notes(self):
         return f"{self.address!r} {self.unit!r} {self.city!r}".upper()
 
+    def normalized_address(self) -> tuple[str, str, str]:
+        return (
+            normalize_address(self.address),
+            normalize_address(self.unit),
+            normalize_address(self.city),
+        )
+
     def print_order_key(self):
         house_num, street = self.address.split(maxsplit=1)
 
@@ -305,6 +589,13 @@ def has_geocode(d: Door) -> TypeIs[_DoorWithGeoCode]:
 
 class Voter(Model):
     TYPE: ClassVar[DatabaseType] = "voter"
+    COMPACT_INTERNED: ClassVar[tuple[str, ...]] = (
+        "activeinactive",
+        "gender",
+        "race",
+        "party",
+        "created_by",
+    )
 
     door_id: ID | None = None
     statevoterid: str = ""
@@ -334,6 +625,11 @@ class Voter(Model):
     def id_for_notes(self):
         return self.statevoterid or str(self.id)
 
+    def phone_numbers(self) -> frozenset[int]:
+        """Normalized cell, landline and best phone numbers"""
+        phones = (self.cellphone, self.landlinephone, self.bestphone)
+        return frozenset(n for p in phones if p and (n := normalize_phone(p)))
+
     def has_demographics(self):
         return self.birthdate and self.gender and self.race
 
@@ -352,26 +648,297 @@ class Voter(Model):
         return system_count < 2
 
 
+class ReadOnlyList[T](Sequence[T]):
+    """A list that can be read but not changed, without copying it"""
+
+    __slots__ = ("_items",)
+
+    def __init__(self, items: list[T]):
+        self._items = items
+
+    def __getitem__(self, idx):
+        return self._items[idx]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[T]:
+        return iter(self._items)
+
+    def __contains__(self, item: object) -> bool:
+        return item in self._items
+
+    def __repr__(self) -> str:
+        return repr(self._items)
+
+
+class ReadOnlyView:
+    """Proxy for a stored model that reads straight through to it (list fields
+    come back as ReadOnlyLists) and refuses writes. Methods still run against
+    the stored model, so things like `last_disposition()` and `add_note()`
+    work, but `save_*` needs a copy from `get_*_by_id`."""
+
+    __slots__ = ("_model",)
+
+    def __init__(self, model: Model):
+        object.__setattr__(self, "_model", model)
+
+    def __getattr__(self, name: str) -> Any:
+        value = getattr(self._model, name)
+        if isinstance(value, list):
+            return ReadOnlyList(value)
+        return value
+
+    def __setattr__(self, name: str, value: Any):
+        raise TypeError(f"{type(self._model).__name__} view is read-only")
+
+    def __repr__(self) -> str:
+        return f"ReadOnlyView({self._model!r})"
+
+
 def is_valid_ordering(models: Sequence[Model]) -> bool:
     return all(m.id == idx for idx, m in enumerate(models))
 
 
 class Database(BaseDatabase):
     DATABASE_FILE_NAME: ClassVar[str] = "database"
+    INDEXED_FIELDS: ClassVar[dict[str, tuple[str, ...]]] = {
+        "turfs": ("login_code", "external_id"),
+        "doors": ("address",),
+        "voters": ("statevoterid", "door_id"),
+        "groups": ("external_id",),
+    }
+    JOURNALED: ClassVar[bool] = True
+    COLLECTIONS: ClassVar[dict[str, type[Model]]] = {
+        "turfs": Turf,
+        "doors": Door,
+        "voters": Voter,
+        "groups": Group,
+    }
+    # index name -> (collection, key function); falsy keys aren't indexed
+    # (a frozenset of keys indexes a record under each of them)
+    SECONDARY_INDEXES: ClassVar[dict[str, tuple[str, Callable[[Any], Hashable]]]] = {
+        "voter_statevoterid": ("voters", lambda v: v.statevoterid),
+        "voter_note_key": ("voters", lambda v: v.id_for_notes()),
+        "voter_phone": ("voters", lambda v: v.phone_numbers()),
+        "door_address": ("doors", lambda d: (d.address, d.unit, d.city)),
+        "door_normalized_address": ("doors", lambda d: d.normalized_address()),
+        "door_note_key": ("doors", lambda d: d.id_for_notes()),
+        "turf_login_code": ("turfs", lambda t: t.login_code),
+        "turf_external_id": ("turfs", lambda t: t.external_id),
+        "turf_note_key": ("turfs", lambda t: t.id_for_notes()),
+        "group_external_id": ("groups", lambda g: g.external_id),
+    }
+    # child collection -> (parent collection, parent id attr, parent's child list)
+    BACKREFS: ClassVar[dict[str, tuple[str, str, str]]] = {
+        "voters": ("doors", "door_id", "voters"),
+        "turfs": ("groups", "group_id", "turfs"),
+    }
 
     turfs: list[Turf] = []
     doors: list[Door] = []
     voters: list[Voter] = []
     groups: list[Group] = []
 
+    # (collection, id) of records saved since the last commit
+    _dirty: set[tuple[str, ID]] = PrivateAttr(default_factory=set)
+    # set for databases built from scratch or with whole collections replaced;
+    # the next commit is then a full checkpoint
+    _dirty_all: bool = PrivateAttr(default=True)
+    # whether records were added since the last commit: their ids are
+    # positions, so another process could take them until they're written
+    _appended: bool = PrivateAttr(default=False)
+    # index name -> key -> ids; built on first use, then kept up to date by
+    # _save_model and apply
+    _indexes: dict[str, dict[Hashable, set[ID]]] | None = PrivateAttr(default=None)
+
+    def __setattr__(self, name: str, value: Any):
+        if name in self.COLLECTIONS:
+            self._dirty_all = True
+            self._indexes = None
+            self.notify({"op": "reset"})
+
+        super().__setattr__(name, value)
+
+    @classmethod
+    def _read(cls) -> tuple[Self, Any]:
+        db, state = super()._read()
+        db._dirty_all = False
+        if COMPACT:
+            db.compact()
+        # (storage may have built them, or had them in the load cache)
+        if db._indexes is None:
+            db.rebuild_indexes()
+        return db, state
+
+    def _reloaded(self, fresh: Self):
+        self._indexes = fresh._indexes
+        self._dirty.clear()
+        self._dirty_all = False
+
+    def has_pending_changes(self) -> bool:
+        return bool(self._dirty or self._dirty_all or self._journal)
+
+    def has_new_records(self) -> bool:
+        return self._appended or self._dirty_all
+
+    def compact(self):
+        """Move voters and doors into column-oriented storage"""
+        for name in ("voters", "doors"):
+            collection = getattr(self, name)
+            if not isinstance(collection, ColumnStore):
+                self.__dict__[name] = ColumnStore(self.COLLECTIONS[name], collection)
+
+    @field_serializer("voters", "doors", mode="wrap")
+    def _serialize_columns(self, value, handler):
+        if isinstance(value, ColumnStore):
+            value = list(value)
+        return handler(value)
+
+    def apply(self, entry: dict[str, Any]):
+        name, id = entry["collection"], entry["id"]
+        if (name, id) in self._dirty or any(
+            e["collection"] == name and e["id"] == id for e in self._journal
+        ):
+            # changed here too, and not written out yet: ours is written
+            # after this one, so it wins
+            return
+
+        collection = getattr(self, name)
+        model = self.COLLECTIONS[name].model_validate(entry["data"])
+
+        if id < len(collection):
+            old_keys = self._index_keys(name, collection[id])
+            collection[id] = model
+        else:
+            old_keys = {}
+            collection.append(model)
+
+        self._reindex(id, old_keys, self._index_keys(name, model))
+        self.notify({"op": "put", "collection": name, "id": id})
+
+    @startup.timed("index build")
+    def rebuild_indexes(self):
+        indexes: dict[str, dict[Hashable, set[ID]]] = {
+            index: {} for index in self.SECONDARY_INDEXES
+        }
+        for name in self.COLLECTIONS:
+            for m in getattr(self, name):
+                for index, keys in self._index_keys(name, m).items():
+                    for key in keys:
+                        indexes[index].setdefault(key, set()).add(m.id)
+
+        self._indexes = indexes
+
+    def index_state(self) -> Any:
+        return self._indexes
+
+    def set_index_state(self, state: Any):
+        self._indexes = state
+
+    def _index_keys(self, name: str, m: Model) -> dict[str, frozenset[Hashable]]:
+        keys = {}
+        for index, (collection, key_func) in self.SECONDARY_INDEXES.items():
+            if collection == name:
+                key = key_func(m)
+                if not isinstance(key, frozenset):
+                    key = frozenset([key])
+                keys[index] = frozenset(k for k in key if k)
+
+        return keys
+
+    def _reindex(
+        self,
+        id: ID,
+        old_keys: dict[str, frozenset[Hashable]],
+        new_keys: dict[str, frozenset[Hashable]],
+    ):
+        if self._indexes is None:
+            return
+
+        for index, keys in old_keys.items():
+            for key in keys - new_keys.get(index, frozenset()):
+                ids = self._indexes[index].get(key, set())
+                ids.discard(id)
+                if not ids:
+                    self._indexes[index].pop(key, None)
+
+        for index, keys in new_keys.items():
+            for key in keys:
+                self._indexes[index].setdefault(key, set()).add(id)
+
+    def lookup_all(self, index: str, key: Hashable) -> frozenset[ID]:
+        """IDs of the records whose keys in a SECONDARY_INDEXES index include
+        `key`"""
+        if self._indexes is None:
+            self.rebuild_indexes()
+            assert self._indexes is not None
+
+        return frozenset(self._indexes[index].get(key, ()))
+
+    def lookup(self, index: str, key: Hashable) -> ID | None:
+        """ID of the record whose key in a SECONDARY_INDEXES index is `key`
+        (the lowest one, if several share it)"""
+        ids = self.lookup_all(index, key)
+        return min(ids) if ids else None
+
+    def flush(self, backup: bool = True):
+        if self._dirty_all:
+            self.checkpoint(backup)
+            return
+
+        self._assert_dirty_constraints()
+        self._record_dirty()
+        super().flush(backup)
+        self._appended = False
+
+    def _record_dirty(self):
+        for name, id in sorted(self._dirty):
+            self.record(
+                {
+                    "op": "put",
+                    "collection": name,
+                    "id": id,
+                    "data": getattr(self, name)[id].model_dump(
+                        mode="json", by_alias=True
+                    ),
+                }
+            )
+
+        self._dirty.clear()
+
+    def _pending_entries(self) -> list[dict[str, Any]]:
+        if self._dirty_all:
+            # a whole new database, with nothing to redo it on
+            logger.warning(
+                "%s was replaced; dropped unsaved changes to all of it",
+                self.DATABASE_FILE_NAME,
+            )
+            return []
+
+        self._record_dirty()
+        return super()._pending_entries()
+
+    def checkpoint(self, backup: bool = True):
+        super().checkpoint(backup)
+        self._dirty.clear()
+        self._dirty_all = False
+        self._appended = False
+
     def get_by_type_and_id(self, typ: DatabaseType, id: ID) -> Model:
         return getattr(self, typ + "s")[id].model_copy(deep=True)
 
+    def view_by_type_and_id(self, typ: DatabaseType, id: ID) -> Model:
+        return cast(Model, ReadOnlyView(getattr(self, typ + "s")[id]))
+
     def get_voter_by_id(self, id: ID) -> Voter:
         return self.voters[id].model_copy(deep=True)
 
+    def view_voter_by_id(self, id: ID) -> Voter:
+        return cast(Voter, ReadOnlyView(self.voters[id]))
+
     def save_voter(self, voter: Voter, *, commit: bool = False) -> Voter:
-        v = self._save_model(voter, self.voters)
+        v = self._save_model(voter)
 
         if commit:
             self.commit()
@@ -380,8 +947,11 @@ class Database(BaseDatabase):
     def get_door_by_id(self, id: ID) -> Door:
         return self.doors[id].model_copy(deep=True)
 
+    def view_door_by_id(self, id: ID) -> Door:
+        return cast(Door, ReadOnlyView(self.doors[id]))
+
     def save_door(self, door: Door, *, commit: bool = False) -> Door:
-        d = self._save_model(door, self.doors)
+        d = self._save_model(door)
 
         if commit:
             self.commit()
@@ -390,8 +960,11 @@ class Database(BaseDatabase):
     def get_turf_by_id(self, id: ID) -> Turf:
         return self.turfs[id].model_copy(deep=True)
 
+    def view_turf_by_id(self, id: ID) -> Turf:
+        return cast(Turf, ReadOnlyView(self.turfs[id]))
+
     def save_turf(self, turf: Turf, *, commit: bool = False) -> Turf:
-        t = self._save_model(turf, self.turfs)
+        t = self._save_model(turf)
 
         if commit:
             self.commit()
@@ -400,8 +973,11 @@ class Database(BaseDatabase):
     def get_group_by_id(self, id: ID) -> Group:
         return self.groups[id].model_copy(deep=True)
 
+    def view_group_by_id(self, id: ID) -> Group:
+        return cast(Group, ReadOnlyView(self.groups[id]))
+
     def save_group(self, group: Group, *, commit: bool = False) -> Group:
-        g = self._save_model(group, self.groups)
+        g = self._save_model(group)
 
         if commit:
             self.commit()
@@ -416,46 +992,147 @@ class Database(BaseDatabase):
 
         match typ:
             case "turf":
-                return self.get_turf_by_id(id).last_disposition()
+                return self.turfs[id].last_disposition()
             case "door":
-                door = self.get_door_by_id(id)
-                voters = [self.get_voter_by_id(v_id) for v_id in door.voters]
+                door = self.doors[id]
+                voters = [self.voters[v_id] for v_id in door.voters]
 
                 return door.last_disposition_with_voters(voters, after)
             case "voter":
-                voter = self.get_voter_by_id(id)
-                return voter.last_disposition(after)
-
-    @functools.cache
-    def voter_ids_by_note_id(self):
-        return {v.id_for_notes(): v.id for v in self.voters}
+                return self.voters[id].last_disposition(after)
 
     def get_voter_by_note_id(self, note_id):
-        v = self.voter_ids_by_note_id()
-        if note_id not in v:
-            self.voter_ids_by_note_id.cache_clear()
-            v = self.voter_ids_by_note_id()
+        voter_id = self.lookup("voter_note_key", note_id)
+        if voter_id is None:
+            raise KeyError(note_id)
+
+        return self.get_voter_by_id(voter_id)
+
+    @contextlib.contextmanager
+    def bulk_append(self) -> Generator[Callable[[Model], ID], None, None]:
+        """For imports (under WRITE_LOCK, if the database is being served):
+        yields `append(record)`, which adds a new record as it is and returns
+        its id, without the copying, reindexing, notifying and dirty tracking
+        save_* do for each record. If anything was appended, listeners then
+        get a reset, indexes are rebuilt on next use, and the next commit is a
+        checkpoint (which also fills in backrefs, like door.voters)."""
+        collections = {
+            model: getattr(self, name) for name, model in self.COLLECTIONS.items()
+        }
+        appended = False
+
+        def append(record: Model) -> ID:
+            nonlocal appended
+            collection = collections[type(record)]
+            record.id_ = len(collection)
+            collection.append(record)
+            appended = True
+            return record.id_
 
-        return self.get_voter_by_id(v[note_id])
+        try:
+            yield append
+        finally:
+            if appended:
+                self._dirty_all = True
+                self._indexes = None
+                self.notify({"op": "reset"})
+
+    def _save_model[T: Model](self, m: T) -> T:
+        with WRITE_LOCK:
+            return self._save_model_locked(m)
+
+    def _save_model_locked[T: Model](self, m: T) -> T:
+        name = m.TYPE + "s"
+        # only now: taking the lock may have reloaded the collection
+        collection: list[T] = getattr(self, name)
+        old_parent_id = None
 
-    def _save_model[T: Model](self, m: T, collection: list[T]) -> T:
         if m.has_id():  # update existing
             model_to_update = collection[m.id]
+            old_keys = self._index_keys(name, model_to_update)
+            if name in self.BACKREFS:
+                old_parent_id = getattr(model_to_update, self.BACKREFS[name][1])
+
             for field in m.model_fields_set:
                 setattr(model_to_update, field, getattr(m, field))
 
+            # write back, for collections that materialize records on access
+            collection[m.id] = model_to_update
             model_result = model_to_update
 
         elif not collection:  # first model
+            old_keys = {}
             model_result = m.with_id(0)
             collection.append(model_result)
+            self._appended = True
 
         else:  # new (not first) model
+            old_keys = {}
             model_result = m.with_id(collection[-1].id + 1)
             collection.append(model_result)
+            self._appended = True
+
+        self._reindex(model_result.id, old_keys, self._index_keys(name, model_result))
+        self._fixup_saved_backrefs(name, model_result.id, old_parent_id)
+        self.notify({"op": "put", "collection": name, "id": model_result.id})
+
+        if not self._dirty_all:
+            self._dirty.add((name, model_result.id))
 
         return model_result.model_copy(deep=True)
 
+    def _fixup_saved_backrefs(self, name: str, id: ID, old_parent_id: ID | None):
+        """fixup_backrefs, but only for the record just saved, so parents'
+        child lists (door.voters, group.turfs) are right straight away rather
+        than at the next commit"""
+        # a saved parent: drop children that don't point at it
+        for child_name, (parent_name, parent_attr, child_list) in self.BACKREFS.items():
+            if name != parent_name:
+                continue
+
+            children = getattr(self, child_name)
+            parent = getattr(self, parent_name)[id]
+            child_ids = getattr(parent, child_list)
+            stray = [c for c in child_ids if getattr(children[c], parent_attr) != id]
+            if stray:
+                for child_id in stray:
+                    child_ids.remove(child_id)
+                self._parent_changed(parent_name, id, parent)
+
+        # a saved child: move it from its old parent to its new one
+        if name not in self.BACKREFS:
+            return
+
+        parent_name, parent_attr, child_list = self.BACKREFS[name]
+        parents = getattr(self, parent_name)
+        parent_id = getattr(getattr(self, name)[id], parent_attr)
+
+        if old_parent_id is not None and old_parent_id != parent_id:
+            old_parent = parents[old_parent_id]
+            if id in (child_ids := getattr(old_parent, child_list)):
+                child_ids.remove(id)
+                self._parent_changed(parent_name, old_parent_id, old_parent)
+
+        if parent_id is not None:
+            parent = parents[parent_id]
+            if id not in (child_ids := getattr(parent, child_list)):
+                child_ids.append(id)
+                self._parent_changed(parent_name, parent_id, parent)
+
+    def _parent_changed(self, name: str, id: ID, parent: Model):
+        # write back, for collections that materialize records on access
+        getattr(self, name)[id] = parent
+        # a changed child list is a change to the parent, for ETags and
+        # listeners like ProgressTracker
+        self.notify({"op": "put", "collection": name, "id": id})
+        if not self._dirty_all:
+            self._dirty.add((name, id))
+
+    def _assert_dirty_constraints(self):
+        for name, id in self._dirty:
+            if getattr(self, name)[id].id != id:
+                raise AssertionError("frick!! tihs is a bug")
+
     def fixup_backrefs(self):
         def _fixup_one_backref_set[
             T: Model, U: Model
@@ -492,6 +1169,7 @@ class Database(BaseDatabase):
 
         _fixup_one_backref_set(self.voters, "voters", self.doors, "door_id")
         _fixup_one_backref_set(self.turfs, "turfs", self.groups, "group_id")
+        self._dirty_all = True
 
     def assert_constraints(self):
         if any(
@@ -500,12 +1178,17 @@ class Database(BaseDatabase):
             raise AssertionError("frick!! tihs is a bug")
 
     def fix_id_duplicates(self):
-        id_lists = [
-            (self.turfs, ["voters", "doors"]),
-            (self.doors, ["voters"]),
-            (self.groups, ["voters", "turfs"]),
-        ]
-        for items, props in id_lists:
-            for prop in props:
-                for item in items:
+        def _dedupe[T: Model](items: list[T], props: list[str]):
+            for idx, item in enumerate(items):
+                for prop in props:
                     setattr(item, prop, sorted(set(getattr(item, prop))))
+                # write back, for collections that materialize records on access
+                items[idx] = item
+
+        _dedupe(self.turfs, ["voters", "doors"])
+        _dedupe(self.doors, ["voters"])
+        _dedupe(self.groups, ["voters", "turfs"])
+
+        self._dirty_all = True
+        self._indexes = None
+        self.notify({"op": "reset"})
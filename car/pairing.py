@@ -0,0 +1,204 @@
+"""Phone pairings: a phone scans a QR code shown to a desktop session, then
+follows whichever voter that session is looking at.
+
+Both sides long-poll: a request carrying the last version it saw is answered
+as soon as the pairing changes, or after WAIT_SECS with the state unchanged.
+A waiting request holds a worker thread, so at most $CAR_PAIRING_MAX_WAITERS
+wait at once (per worker); past that, requests are turned away with a
+TooManyWaiters and retried later, leaving the rest of the threads for pages.
+Pairings nobody has touched for $CAR_PAIRING_TTL_SECS are dropped.
+
+Pairing state lives in the cache, so with a shared cache backend the phone's
+requests can be served by a different worker than the desktop's. Changes
+wake waiters in this process straight away, and ones in other workers
+through a Wakeup.
+"""
+
+import contextlib
+import os
+import socket
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+from .cache import Cache
+from .storage import DATA_ROOT
+
+PAIRING_TTL_SECS = int(os.getenv("CAR_PAIRING_TTL_SECS", str(12 * 60 * 60)))
+PAIRING_MAX_WAITERS = int(os.getenv("CAR_PAIRING_MAX_WAITERS", "16"))
+# how long a long-poll waits for a change before answering anyway
+WAIT_SECS = 20
+# how long a turned away request should wait before trying again
+RETRY_SECS = 5
+# how stale "seen" can get before reading a pairing extends its TTL
+TOUCH_SECS = 60
+
+
+class TooManyWaiters(Exception):
+    pass
+
+
+class Wakeup:
+    """Wakes up the other processes sharing `directory`: each one that
+    listen()s binds a Unix datagram socket there, and send() writes a byte
+    to all of them, which calls their `on_wake`"""
+
+    def __init__(self, directory: str, on_wake: Callable[[], None]):
+        self.directory = directory
+        self.on_wake = on_wake
+        self._lock = threading.Lock()
+        self._pid = 0
+
+    def listen(self):
+        """Start this process's listener, unless it's running already"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            # (a listener inherited over fork isn't running here)
+            self._pid = os.getpid()
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{self._pid}.sock")
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(path)
+            threading.Thread(
+                target=self._run, args=(sock,), name="car-pairing-wakeup", daemon=True
+            ).start()
+
+    def _run(self, sock: socket.socket):
+        while True:
+            sock.recv(16)
+            self.on_wake()
+
+    def send(self):
+        try:
+            files = os.listdir(self.directory)
+        except FileNotFoundError:
+            # nobody has listened yet
+            return
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            for file in files:
+                path = os.path.join(self.directory, file)
+                try:
+                    sock.sendto(b"!", path)
+                except BlockingIOError:
+                    # its queue is full of wakeups already
+                    pass
+                except ConnectionRefusedError:
+                    # left behind by a process that's gone
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+class Pairings:
+    def __init__(
+        self,
+        cache: Cache,
+        ttl: float = PAIRING_TTL_SECS,
+        shared: bool = False,
+        max_waiters: int = PAIRING_MAX_WAITERS,
+    ):
+        """`shared`: whether other processes use the same cache"""
+        self.cache = cache
+        self.ttl = ttl
+        # pairing state is {..., "version": time_ns of the last change,
+        # "seen": time of the last use}
+        self._changed = threading.Condition()
+        # bumped under _changed with every change, so waiters can read the
+        # cache outside it without missing one
+        self._changes = 0
+        self._updating = threading.Lock()
+        self._waiters = threading.BoundedSemaphore(max_waiters)
+        self._wakeup = None
+        if shared:
+            self._wakeup = Wakeup(
+                os.path.join(DATA_ROOT, "pairing-wakeup"), self._notify_all
+            )
+
+    def _notify_all(self):
+        with self._changed:
+            self._changes += 1
+            self._changed.notify_all()
+
+    def _key(self, code: str) -> str:
+        return f"pairing_{code}"
+
+    def _put(self, code: str, state: dict[str, Any]):
+        self.cache.set(self._key(code), state, self.ttl)
+
+    def create(self, code: str, **state: Any):
+        self._put(code, state | {"version": time.time_ns(), "seen": time.time()})
+
+    def get(self, code: str) -> dict[str, Any] | None:
+        if (state := self.cache.get(self._key(code))) is None:
+            return None
+
+        state = dict(state)
+        if (now := time.time()) - state["seen"] > TOUCH_SECS:
+            state["seen"] = now
+            self._put(code, state)
+        return state
+
+    def update(self, code: str, **changes: Any):
+        """Apply `changes` to a pairing, waking its listeners if anything
+        actually changed"""
+        with self._updating:
+            if (state := self.get(code)) is None:
+                return
+
+            if all(state.get(k) == v for k, v in changes.items()):
+                return
+
+            state |= changes | {"version": time.time_ns(), "seen": time.time()}
+            self._put(code, state)
+
+        self._notify_all()
+        if self._wakeup is not None:
+            self._wakeup.send()
+
+    def wait(self, code: str, version: int, timeout: float) -> dict[str, Any] | None:
+        """The pairing's state once its version is past `version`, or after
+        `timeout` seconds, whichever is first. Raises TooManyWaiters if too
+        many requests are waiting already."""
+        if self._wakeup is not None:
+            self._wakeup.listen()
+
+        if not self._waiters.acquire(blocking=False):
+            raise TooManyWaiters()
+
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                with self._changed:
+                    changes = self._changes
+
+                state = self.get(code)
+                if state is None or state["version"] != version:
+                    return state
+
+                if (left := deadline - time.monotonic()) <= 0:
+                    return state
+
+                with self._changed:
+                    # (unless it changed while we were reading it)
+                    if self._changes == changes:
+                        self._changed.wait(left)
+        finally:
+            self._waiters.release()
+
+    def poll(self, code: str, version: int = -1) -> dict[str, Any] | None:
+        """A long-poll: `wait` for WAIT_SECS, with the state as sent to
+        clients"""
+        state = self.wait(code, version, WAIT_SECS)
+        if state is None:
+            return None
+
+        return {k: v for k, v in state.items() if k != "seen"}
@@ -0,0 +1,136 @@
+"""Per-turf queues of voters left to call in a phonebank.
+
+Each queue is filtered once, when a turf is first phonebanked, down to the
+voters with a phone number and no notes. Callers take voters under a lease,
+kept in the cache so workers sharing a cache backend don't hand out the same
+voter; a voter stays out of the queue until their lease runs out, and leaves
+for good once they get a note or lose their phone number."""
+
+import heapq
+import random
+import threading
+import time
+from collections import deque
+from typing import Any
+
+from .cache import Cache
+from .model import ID, Database, NoteDatabase, Voter
+
+
+def is_phone(k: str):
+    return len([i for i in k if i.isnumeric()]) > 7
+
+
+def should_call(voter: Voter) -> bool:
+    # don't phonebank anyone who we've conversed with before, or... you know,
+    # anyone without a phone...
+    # TODO - use the phone_key to decide config, and check SMS for textbanks
+    return not voter.notes and is_phone(voter.bestphone)
+
+
+def lease_key(voter_id: ID) -> str:
+    return f"last_seen_{voter_id}"
+
+
+class PhonebankQueue:
+    def __init__(self, voter_ids: list[ID], cache: Cache, lease_secs: float):
+        self.cache = cache
+        self.lease_secs = lease_secs
+        self._eligible = set(voter_ids)
+        self._queue = deque(random.sample(voter_ids, len(voter_ids)))
+        # (time, voter id) of leased voters to put back in the queue once
+        # their lease may have run out
+        self._recheck: list[tuple[float, ID]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._eligible)
+
+    def take(self, now: float | None = None) -> ID | None:
+        """Lease the next voter to call, if there are any left"""
+        now = time.time() if now is None else now
+
+        with self._lock:
+            while self._recheck and self._recheck[0][0] <= now:
+                _, voter_id = heapq.heappop(self._recheck)
+                self._queue.append(voter_id)
+
+            # removed voters are dropped from the deque lazily, here
+            while self._queue:
+                voter_id = self._queue.popleft()
+                if voter_id not in self._eligible:
+                    continue
+
+                # whether or not we get the lease, it's out for up to
+                # lease_secs
+                heapq.heappush(self._recheck, (now + self.lease_secs, voter_id))
+                if self.cache.add(lease_key(voter_id), now, self.lease_secs):
+                    return voter_id
+
+        return None
+
+    def add(self, voter_id: ID):
+        with self._lock:
+            if voter_id not in self._eligible:
+                self._eligible.add(voter_id)
+                self._queue.append(voter_id)
+
+    def remove(self, voter_id: ID):
+        with self._lock:
+            self._eligible.discard(voter_id)
+
+        self.cache.delete(lease_key(voter_id))
+
+
+class PhonebankQueues:
+    """A PhonebankQueue per phonebank turf, built on first use and kept up to
+    date from database change notifications"""
+
+    def __init__(
+        self, db: Database, note_db: NoteDatabase, cache: Cache, lease_secs: float
+    ):
+        self.db = db
+        self.cache = cache
+        self.lease_secs = lease_secs
+        self._queues: dict[ID, PhonebankQueue] = {}
+        self._lock = threading.Lock()
+
+        db.subscribe(self._on_change)
+        note_db.subscribe(self._on_change)
+
+    def get(self, turf_id: ID) -> PhonebankQueue:
+        with self._lock:
+            if turf_id not in self._queues:
+                turf = self.db.turfs[turf_id]
+                voter_ids = [v for v in turf.voters if should_call(self.db.voters[v])]
+                self._queues[turf_id] = PhonebankQueue(
+                    voter_ids, self.cache, self.lease_secs
+                )
+
+            return self._queues[turf_id]
+
+    def take(self, turf_id: ID) -> ID | None:
+        return self.get(turf_id).take()
+
+    def _on_change(self, entry: dict[str, Any]):
+        match entry:
+            case {"op": "reset"}:
+                with self._lock:
+                    self._queues.clear()
+
+            case {"op": "put", "collection": "turfs", "id": turf_id}:
+                with self._lock:
+                    self._queues.pop(turf_id, None)
+
+            case {"op": "note", "typ": "voter", "id": key}:
+                if (voter_id := self.db.lookup("voter_note_key", key)) is not None:
+                    for queue in list(self._queues.values()):
+                        queue.remove(voter_id)
+
+            case {"op": "put", "collection": "voters", "id": voter_id}:
+                voter = self.db.voters[voter_id]
+                for turf_id, queue in list(self._queues.items()):
+                    if not should_call(voter):
+                        queue.remove(voter_id)
+                    elif voter_id in self.db.turfs[turf_id].voters:
+                        queue.add(voter_id)
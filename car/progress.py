@@ -0,0 +1,185 @@
+"""Per-turf progress counters, kept up to date as notes come in so the index
+and progress pages don't walk every door of every turf."""
+
+from collections import Counter, defaultdict
+from typing import Any
+
+from .model import ID, Database, Disposition, NoteDatabase, Turf
+
+
+class TurfProgress:
+    __slots__ = (
+        "turf_id",
+        "voter_ids",
+        "disposition",
+        "started_at",
+        "door_dispositions",
+        "counts",
+        "contacted",
+        "last_activity",
+    )
+
+    def __init__(self, turf_id: ID):
+        self.turf_id = turf_id
+        self.voter_ids: tuple[ID, ...] = ()
+        self.disposition: Disposition = None
+        self.started_at: str | None = None
+        self.door_dispositions: dict[ID, Disposition] = {}
+        # door disposition -> number of doors, None meaning untouched
+        self.counts: Counter[Disposition] = Counter()
+        # voters with a disposition since the turf was started
+        self.contacted: set[ID] = set()
+        self.last_activity: str | None = None
+
+    def seen(self, ts: str):
+        if self.last_activity is None or ts > self.last_activity:
+            self.last_activity = ts
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "disposition": self.disposition,
+            "doors_untouched": self.counts[None],
+            "doors_attempted": self.counts["attempted"],
+            "doors_done": self.counts["done"],
+            "doors_refused": self.counts["refused"],
+            "doors_do_not_contact": self.counts["do-not-contact"],
+            "voters_contacted": len(self.contacted),
+            "last_activity": self.last_activity,
+        }
+
+
+class ProgressTracker:
+    """TurfProgress for every turf. Built in one pass over the databases, then
+    updated from their change notifications: a note only touches the turfs
+    containing its door or voter."""
+
+    def __init__(self, db: Database, note_db: NoteDatabase):
+        self.db = db
+        self.note_db = note_db
+        self.rebuild()
+
+        db.subscribe(self._on_change)
+        note_db.subscribe(self._on_change)
+
+    def rebuild(self):
+        self._turfs: dict[ID, TurfProgress] = {}
+        self._door_turfs: defaultdict[ID, set[ID]] = defaultdict(set)
+        self._voter_turfs: defaultdict[ID, set[ID]] = defaultdict(set)
+        # voter -> door, for the voters at doors in turfs, so a voter moving
+        # updates the door it left too
+        self._voter_doors: dict[ID, ID | None] = {}
+
+        for turf in self.db.turfs:
+            self._add_turf(turf)
+
+    def get(self, turf_id: ID) -> TurfProgress:
+        return self._turfs[turf_id]
+
+    def _add_turf(self, turf: Turf):
+        progress = self._turfs[turf.id] = TurfProgress(turf.id)
+        progress.voter_ids = tuple(turf.voters)
+        for door_id in turf.doors:
+            self._door_turfs[door_id].add(turf.id)
+            for voter_id in self.db.doors[door_id].voters:
+                self._voter_doors[voter_id] = door_id
+
+        for voter_id in turf.voters:
+            self._voter_turfs[voter_id].add(turf.id)
+
+        self._recompute(progress, turf)
+
+    def _remove_turf(self, turf_id: ID):
+        progress = self._turfs.pop(turf_id)
+        for door_id in progress.door_dispositions:
+            self._door_turfs[door_id].discard(turf_id)
+
+        for voter_id in progress.voter_ids:
+            self._voter_turfs[voter_id].discard(turf_id)
+
+    def _recompute(self, progress: TurfProgress, turf: Turf):
+        """Start over for one turf, after it's been started or finished"""
+        progress.disposition = turf.last_disposition()
+        progress.started_at = turf.started_at()
+        progress.door_dispositions.clear()
+        progress.counts.clear()
+        progress.contacted.clear()
+        if turf.notes:
+            progress.seen(turf.notes[0].ts)
+
+        for door_id in turf.doors:
+            self._update_door(progress, door_id)
+
+        for voter_id in turf.voters:
+            self._update_voter(progress, voter_id)
+
+    def _update_door(self, progress: TurfProgress, door_id: ID):
+        door = self.db.doors[door_id]
+        voters = [self.db.voters[v] for v in door.voters]
+
+        if door_id in progress.door_dispositions:
+            progress.counts[progress.door_dispositions[door_id]] -= 1
+
+        disposition = door.last_disposition_with_voters(voters, progress.started_at)
+        progress.door_dispositions[door_id] = disposition
+        progress.counts[disposition] += 1
+
+        if door.notes:
+            progress.seen(door.notes[0].ts)
+
+    def _update_voter(self, progress: TurfProgress, voter_id: ID):
+        voter = self.db.voters[voter_id]
+        if voter.last_disposition(progress.started_at):
+            progress.contacted.add(voter_id)
+        else:
+            progress.contacted.discard(voter_id)
+
+        if voter.notes:
+            progress.seen(voter.notes[0].ts)
+
+    def _on_change(self, entry: dict[str, Any]):
+        match entry:
+            case {"op": "reset"}:
+                self.rebuild()
+
+            case {"op": "note", "typ": "turf", "id": key}:
+                turf_id = self.db.lookup("turf_note_key", key)
+                if turf_id is not None:
+                    self._recompute(self._turfs[turf_id], self.db.turfs[turf_id])
+
+            case {"op": "note", "typ": "door", "id": key}:
+                door_id = self.db.lookup("door_note_key", key)
+                if door_id is not None:
+                    self._door_changed(door_id)
+
+            case {"op": "note", "typ": "voter", "id": key}:
+                voter_id = self.db.lookup("voter_note_key", key)
+                if voter_id is not None:
+                    self._voter_changed(voter_id)
+
+            case {"op": "put", "collection": "turfs", "id": turf_id}:
+                if turf_id in self._turfs:
+                    self._remove_turf(turf_id)
+                self._add_turf(self.db.turfs[turf_id])
+
+            case {"op": "put", "collection": "doors", "id": door_id}:
+                self._door_changed(door_id)
+
+            case {"op": "put", "collection": "voters", "id": voter_id}:
+                self._voter_changed(voter_id)
+
+    def _door_changed(self, door_id: ID):
+        for turf_id in self._door_turfs.get(door_id, ()):
+            self._update_door(self._turfs[turf_id], door_id)
+
+    def _voter_changed(self, voter_id: ID):
+        door_id = self.db.voters[voter_id].door_id
+        old_door_id = self._voter_doors.get(voter_id)
+        self._voter_doors[voter_id] = door_id
+        for turf_id in self._voter_turfs.get(voter_id, ()):
+            self._update_voter(self._turfs[turf_id], voter_id)
+
+        if old_door_id is not None and old_door_id != door_id:
+            self._door_changed(old_door_id)
+
+        if door_id is not None:
+            self._door_changed(door_id)
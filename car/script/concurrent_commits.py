@@ -0,0 +1,96 @@
+"""Check that two processes committing to the same database at the same time,
+each run the way a single-worker app or a script is (without $CAR_WORKERS),
+lose none of each other's changes: each edits its own voters and takes a
+note on each, committing every change, with checkpoints frequent enough to
+happen in the middle of the other's commits. Exits non-zero if anything is
+missing afterwards. Uses $CAR_STORAGE, like the app.
+
+    python3 -m car.script.concurrent_commits [commits per process]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+WORKER = sys.argv[1:2] == ["worker"]
+if not WORKER:
+    # the processes share a scratch directory, never the real data
+    os.environ["CAR_DATA_PATH"] = tempfile.mkdtemp(prefix="car-concurrent-commits-")
+    os.environ.pop("CAR_WORKERS", None)
+    os.environ.setdefault("CAR_JOURNAL_CHECKPOINT_ENTRIES", "50")
+
+from ..model import Database, Note, NoteDatabase  # noqa: E402
+from .synthetic import synthetic_database  # noqa: E402
+
+PROCESSES = 2
+AUTHOR = "concurrent_commits"
+
+
+def work(process: int, n: int):
+    database = Database.get()
+    NoteDatabase.get()
+    print("ready", flush=True)
+    # wait for the go, so both processes commit at the same time
+    sys.stdin.readline()
+
+    for i in range(n):
+        voter = database.get_voter_by_id(process * n + i)
+        voter.firstname = f"PROCESS {process}"
+        database.save_voter(voter, commit=True)
+        voter.add_note(Note(note=f"{process}-{i}", author=AUTHOR), commit=True)
+
+
+def main():
+    if WORKER:
+        work(int(sys.argv[2]), int(sys.argv[3]))
+        return
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    synthetic_database(PROCESSES * n).checkpoint(backup=False)
+    NoteDatabase().checkpoint(backup=False)
+
+    processes = [
+        subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "car.script.concurrent_commits",
+                "worker",
+                str(process),
+                str(n),
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        for process in range(PROCESSES)
+    ]
+    for p in processes:
+        assert p.stdout is not None and p.stdout.readline() == "ready\n"
+    for p in processes:
+        assert p.stdin is not None
+        p.stdin.write("go\n")
+        p.stdin.close()
+    if any(p.wait() for p in processes):
+        sys.exit("a process failed")
+
+    database = Database.get()
+    lost_edits = lost_notes = 0
+    for process in range(PROCESSES):
+        for i in range(n):
+            voter = database.voters[process * n + i]
+            if voter.firstname != f"PROCESS {process}":
+                lost_edits += 1
+            if f"{process}-{i}" not in {note.note for note in voter.notes}:
+                lost_notes += 1
+
+    print(f"{PROCESSES} processes x {n} commits each:")
+    print(f"  lost edits: {lost_edits}")
+    print(f"  lost notes: {lost_notes}")
+    if lost_edits or lost_notes:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
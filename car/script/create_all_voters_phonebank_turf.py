@@ -1,16 +1,19 @@
 from ..model import Turf
+from ..storage import WRITE_LOCK
 from .update_voter_turfs import assign_login_codes, database
 
-turf = Turf(
-    desc="All Voters",
-    created_by="system",
-    phone_key="default",
-)
-turf = database.save_turf(turf)
+# the app's writes wait for ours, and ours start from everything it committed
+with WRITE_LOCK:
+    turf = Turf(
+        desc="All Voters",
+        created_by="system",
+        phone_key="default",
+    )
+    turf = database.save_turf(turf)
 
-turf.voters = [v.id for v in database.voters]
-turf = database.save_turf(turf)
+    turf.voters = [v.id for v in database.voters]
+    turf = database.save_turf(turf)
 
-assign_login_codes()
+    assign_login_codes()
 
-database.commit()
+    database.commit()
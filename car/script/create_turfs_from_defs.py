@@ -7,6 +7,7 @@ from typing import Any, Protocol
 import yaml
 
 from ..model import Group, Turf
+from ..storage import WRITE_LOCK
 from .update_voter_turfs import assign_login_codes, database
 
 # load voter score data
@@ -103,58 +104,64 @@ def main():
     turf_configs = [c for c in configs if c["type"] == "turf"]
     group_configs = [c for c in configs if c["type"] == "group"]
 
-    if os.getenv("RESET"):
-        print("Reset existing turfs and groups!")
-        database.turfs = []
-        database.groups = []
-        database.commit()
+    # the app's writes wait for ours, and ours start from everything it
+    # committed
+    with WRITE_LOCK:
+        if os.getenv("RESET"):
+            print("Reset existing turfs and groups!")
+            database.turfs = []
+            database.groups = []
+            database.commit()
+
+        # get existing turfs/groups
+        turfs_by_external_id = get_by_external_id(
+            database.turfs,
+            make_list_of_defs(Turf, turf_configs),
+            database.save_turf,
+        )
+        groups_by_external_id = get_by_external_id(
+            database.groups,
+            make_list_of_defs(Group, group_configs),
+            database.save_group,
+        )
 
-    # get existing turfs/groups
-    turfs_by_external_id = get_by_external_id(
-        database.turfs,
-        make_list_of_defs(Turf, turf_configs),
-        database.save_turf,
-    )
-    groups_by_external_id = get_by_external_id(
-        database.groups,
-        make_list_of_defs(Group, group_configs),
-        database.save_group,
-    )
-
-    # process turfs
-    print("processing turfs...")
-    for config in turf_configs:
-        turf = turfs_by_external_id[config["name"]]
-        turf.voters = [
-            voter.id for voter in database.voters if test_voter(voter, config["rule"])
-        ]
-
-        database.save_turf(turf)
-
-    # process groups
-    print("processing groups...")
-    for config in group_configs:
-        group = groups_by_external_id[config["name"]]
-
-        if "turfs" not in config:
-            group.voters = [
+        # process turfs
+        print("processing turfs...")
+        for config in turf_configs:
+            turf = turfs_by_external_id[config["name"]]
+            turf.voters = [
                 voter.id
                 for voter in database.voters
                 if test_voter(voter, config["rule"])
             ]
-            database.save_group(group)
-        else:
-            for turf_external_id in config["turfs"]:
-                turf = turfs_by_external_id[turf_external_id]
-                group.turfs.append(turf.id)
-                turf.group_id = group.id
-                database.save_turf(turf)
-                group.voters.extend(turf.voters)
+
+            database.save_turf(turf)
+
+        # process groups
+        print("processing groups...")
+        for config in group_configs:
+            group = groups_by_external_id[config["name"]]
+
+            if "turfs" not in config:
+                group.voters = [
+                    voter.id
+                    for voter in database.voters
+                    if test_voter(voter, config["rule"])
+                ]
                 database.save_group(group)
+            else:
+                for turf_external_id in config["turfs"]:
+                    turf = turfs_by_external_id[turf_external_id]
+                    group.turfs.append(turf.id)
+                    turf.group_id = group.id
+                    database.save_turf(turf)
+                    group.voters.extend(turf.voters)
+                    database.save_group(group)
+
+        assign_login_codes()
+        database.fix_id_duplicates()
+        database.commit()
 
-    assign_login_codes()
-    database.fix_id_duplicates()
-    database.commit()
     print("done!")
 
 
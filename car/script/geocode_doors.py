@@ -2,7 +2,8 @@ import csv
 import os
 import sys
 
-from ..model import Database, has_geocode
+from ..model import ID, Database, has_geocode
+from ..storage import WRITE_LOCK
 
 sys.path.insert(
     0, os.path.join(os.path.abspath(os.path.dirname(__file__)), "../../../geocode")
@@ -14,6 +15,9 @@ database = Database.get()
 
 todos = []
 todones = {}
+# door id -> (lat, lon), saved all at once at the end, so the app isn't kept
+# waiting on the geocoder
+located: dict[ID, tuple[float, float]] = {}
 
 with open("already_geocoded.txt") as f:
     already_geocoded = set(int(x.strip()) for x in f)
@@ -32,13 +36,13 @@ for door in database.doors:
 
     if todone_result := todones.get((door.address, door.city)):
         print("Updated geocoding result from cached for", door.address, door.city)
-        door.lat, door.lon = todone_result
+        located[door.id] = todone_result
 
     else:
         result = geocoder.geocode(door.address, door.city, unit=door.unit)
         if result is not None:
             print("Updated geocoding result for", door.address, door.city)
-            door.lat, door.lon = result
+            located[door.id] = result
 
         else:
             # save to todos file
@@ -46,9 +50,13 @@ for door in database.doors:
                 {"address": door.address, "city": door.city, "state": "ALABAMA"}
             )
 
-    database.save_door(door)
+with WRITE_LOCK:
+    for door_id, (lat, lon) in located.items():
+        door = database.get_door_by_id(door_id)
+        door.lat, door.lon = lat, lon
+        database.save_door(door)
 
-database.commit()
+    database.commit()
 
 with open("geocode-todos.csv", "w") as f:
     csv.DictWriter(f, ["address", "city", "state"]).writerows(todos)
@@ -1,18 +1,11 @@
-import csv
 import json
 from typing import Any
 
-from ..model import Database, Door, Voter
+from ..importer import DoorKey, Row, VoterFile, import_voter_file
+from ..model import ID, Database, Door, Voter
 
 VOTER_FILE = "132180_Deliverable.csv"
-
-f = open(VOTER_FILE)
-lines = csv.DictReader(f)
-
-database = Database()
-
-doors: dict[tuple[str, str, str], Door] = {}
-targeting_data: dict[str, Any] = {}
+TARGETING_DATA_OUT = "targeting_data.json"
 
 
 def fix_date(x):
@@ -59,78 +52,108 @@ def race(x):
     }[q]
 
 
-for line in lines:
-    addr = line["Residence_Addresses_AddressLine"]
-    unit = " ".join(
-        filter(
-            None,
-            [
-                line["Residence_Addresses_ApartmentType"],
-                line["Residence_Addresses_ApartmentNum"],
-            ],
-        )
-    )
-    city = line["Residence_Addresses_City"]
-
-    if unit:
-        addr = addr.replace(unit, "")
-        addr = addr.strip()
-
-    door_key = (addr, unit, city)
-    if door_key not in doors:
-        doors[door_key] = database.save_door(
-            Door(
-                address=addr,
-                unit=unit,
-                city=city,
-                lat=float_or_none(line["Residence_Addresses_Latitude"]),
-                lon=float_or_none(line["Residence_Addresses_Longitude"]),
-                created_by="voter import",
-            )
-        )
-
-    targeting_data[line["Voters_StateVoterID"]] = {
+def targeting_data(row: Row) -> dict[str, Any]:
+    return {
         "scores": {
             key: int_or_none(value)
-            for key, value in line.items()
+            for key, value in row.items()
             if key.startswith("hs_")
         },
         "consumer": {
             key: autotype(value)
-            for key, value in line.items()
+            for key, value in row.items()
             if key.startswith("ConsumerData_")
         },
-        "gender": line["Voters_Gender"],
-        "party": line["hf_ideology_overall_party"],
-        "age": int_or_none(line["Voters_Age"]),
+        "gender": row["Voters_Gender"],
+        "party": row["hf_ideology_overall_party"],
+        "age": int_or_none(row["Voters_Age"]),
     }
 
-    database.save_voter(
-        Voter(
-            statevoterid=line["Voters_StateVoterID"],
-            activeinactive=line["Voters_Active"],
-            firstname=line["Voters_FirstName"],
-            middlename=line["Voters_MiddleName"],
-            lastname=line["Voters_LastName"],
-            landlinephone=line["VoterTelephones_LandlineFormatted"],
-            cellphone=line["VoterTelephones_CellPhoneFormatted"],
-            gender=line["Voters_Gender"] or "U",
-            party=line["hf_ideology_overall_party"],
-            race=race(line),
-            birthdate=fix_date(line["Voters_BirthDate"]),
-            regdate=fix_date(line["Voters_CalculatedRegDate"]),
+
+class L2VoterFile(VoterFile):
+    """An L2 deliverable. Each voter's scores and consumer data go to a JSON
+    object keyed by state voter ID, written as the import goes."""
+
+    def __init__(self, path: str, targeting_data_path: str | None = None):
+        super().__init__(path)
+        self.targeting_data_path = targeting_data_path
+        self._targeting_file = None
+
+    def door_key(self, row: Row) -> DoorKey:
+        addr = row["Residence_Addresses_AddressLine"]
+        unit = " ".join(
+            filter(
+                None,
+                [
+                    row["Residence_Addresses_ApartmentType"],
+                    row["Residence_Addresses_ApartmentNum"],
+                ],
+            )
+        )
+
+        if unit:
+            addr = addr.replace(unit, "")
+            addr = addr.strip()
+
+        return addr, unit, row["Residence_Addresses_City"]
+
+    def door(self, row: Row, key: DoorKey) -> Door:
+        door = super().door(row, key)
+        door.lat = float_or_none(row["Residence_Addresses_Latitude"])
+        door.lon = float_or_none(row["Residence_Addresses_Longitude"])
+        return door
+
+    def voter(self, row: Row, door_id: ID) -> Voter:
+        return Voter(
+            statevoterid=row["Voters_StateVoterID"],
+            activeinactive=row["Voters_Active"],
+            firstname=row["Voters_FirstName"],
+            middlename=row["Voters_MiddleName"],
+            lastname=row["Voters_LastName"],
+            landlinephone=row["VoterTelephones_LandlineFormatted"],
+            cellphone=row["VoterTelephones_CellPhoneFormatted"],
+            gender=row["Voters_Gender"] or "U",
+            party=row["hf_ideology_overall_party"],
+            race=race(row),
+            birthdate=fix_date(row["Voters_BirthDate"]),
+            regdate=fix_date(row["Voters_CalculatedRegDate"]),
             created_by="system import",
-            door_id=doors[door_key].id,
+            door_id=door_id,
             bestphone=(
-                line["VoterTelephones_CellPhoneFormatted"]
-                or line["VoterTelephones_LandlineFormatted"]
+                row["VoterTelephones_CellPhoneFormatted"]
+                or row["VoterTelephones_LandlineFormatted"]
             ),
         )
-    )
 
+    def imported(self, row: Row, voter: Voter):
+        if self.targeting_data_path is None:
+            return
+
+        key = json.dumps(voter.statevoterid)
+        value = json.dumps(targeting_data(row))
+        if self._targeting_file is None:
+            self._targeting_file = open(self.targeting_data_path, "w")
+            self._targeting_file.write(f"{{{key}: {value}")
+        else:
+            self._targeting_file.write(f", {key}: {value}")
+
+    def finish(self):
+        if self._targeting_file is not None:
+            self._targeting_file.write("}")
+            self._targeting_file.close()
+        elif self.targeting_data_path is not None:
+            with open(self.targeting_data_path, "w") as f:
+                f.write("{}")
+
+
+def main():
+    database = Database()
+
+    stats = import_voter_file(database, L2VoterFile(VOTER_FILE, TARGETING_DATA_OUT))
+    print(dict(stats))
+
+    database.commit(backup=False)
 
-database.commit(backup=False)
-f.close()
 
-with open("targeting_data.json", "w") as f:
-    json.dump(targeting_data, f)
+if __name__ == "__main__":
+    main()
@@ -1,87 +1,79 @@
 import csv
 
-from ..model import Database, Door, Turf, Voter
+from ..importer import DoorKey, Row, VoterFile, import_voter_file
+from ..model import ID, Database, Turf, Voter
 
 VOTER_FILE = "SOSVoterList_20260219_8835.csv"
 TARGETING_DATA_FILE = "targeting_data.csv"
 
-with open(TARGETING_DATA_FILE) as f:
-    targeting_lines = list(csv.DictReader(f))
-    targeting_data = {line["id"]: line for line in targeting_lines}
 
-
-with open(VOTER_FILE) as f:
-    lines = list(csv.DictReader(f))
-
-
-database = Database()
-database.save_turf(Turf(desc="All Voters", created_by="system import"))
-
-doors: dict[tuple[str, str, str], Door] = {}
-
-
-for line in lines:
-    if line["Registrant ID"] not in targeting_data:
-        continue
-
-    addr = " ".join(
-        filter(
-            None,
-            [
-                line["Residential Address Number"],
-                line["Residential Address Number Suffix"],
-                line["Residential Address Direction"],
-                line["Residential Address Name"],
-                line["Residential Address Type"],
-                line["Residential Address Direction Suffix"],
-            ],
-        )
-    )
-
-    unit = " ".join(
-        filter(
-            None,
-            [
-                line["Residential Unit Type"],
-                line["Residential Unit Number"],
-            ],
+class SOSVoterFile(VoterFile):
+    """An Alabama Secretary of State voter file export, limited to the voters
+    in the targeting data"""
+
+    def __init__(self, path: str, targeting_data_path: str):
+        super().__init__(path)
+        with open(targeting_data_path) as f:
+            self.targeted = {line["id"] for line in csv.DictReader(f)}
+
+    def include(self, row: Row) -> bool:
+        return row["Registrant ID"] in self.targeted
+
+    def door_key(self, row: Row) -> DoorKey:
+        addr = " ".join(
+            filter(
+                None,
+                [
+                    row["Residential Address Number"],
+                    row["Residential Address Number Suffix"],
+                    row["Residential Address Direction"],
+                    row["Residential Address Name"],
+                    row["Residential Address Type"],
+                    row["Residential Address Direction Suffix"],
+                ],
+            )
         )
-    )
-
-    city = line["Residential City"]
-
-    # get or create the door
-    door_key = (addr, unit, city)
-    if door_key not in doors:
-        doors[door_key] = database.save_door(
-            Door(
-                address=addr,
-                unit=unit,
-                city=city,
-                created_by="voter import",
+
+        unit = " ".join(
+            filter(
+                None,
+                [
+                    row["Residential Unit Type"],
+                    row["Residential Unit Number"],
+                ],
             )
         )
 
-    door = doors[door_key]
-
-    # create the voter
-    voter_phone = f"({line['Phone - Area Code']}) {line['Phone Number - Exchange']}-{line['Phone Number - Last Four Digits']}"
-    database.save_voter(
-        Voter(
-            statevoterid=line["Registrant ID"],
-            activeinactive=line["Registrant Status"],
-            firstname=line["First Name"],
-            middlename=line["Middle Name"],
-            lastname=line["Last Name"],
+        return addr, unit, row["Residential City"]
+
+    def voter(self, row: Row, door_id: ID) -> Voter:
+        voter_phone = f"({row['Phone - Area Code']}) {row['Phone Number - Exchange']}-{row['Phone Number - Last Four Digits']}"
+        return Voter(
+            statevoterid=row["Registrant ID"],
+            activeinactive=row["Registrant Status"],
+            firstname=row["First Name"],
+            middlename=row["Middle Name"],
+            lastname=row["Last Name"],
             landlinephone=voter_phone,
-            gender=line["Gender"],
-            race=line["Race"],
-            birthdate=f"{2026 - int(line['Age'])}-01-01",
-            regdate=line["Date of Registration"],
+            gender=row["Gender"],
+            race=row["Race"],
+            birthdate=f"{2026 - int(row['Age'])}-01-01",
+            regdate=row["Date of Registration"],
             created_by="system import",
-            door_id=door.id,
+            door_id=door_id,
             bestphone=voter_phone,
         )
-    )
 
-database.commit(backup=False)
+
+def main():
+    database = Database()
+    database.save_turf(Turf(desc="All Voters", created_by="system import"))
+
+    stats = import_voter_file(database, SOSVoterFile(VOTER_FILE, TARGETING_DATA_FILE))
+    print(dict(stats))
+
+    database.commit(backup=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Drive a simulated canvass against gunicorn with one worker and with
+several, on a synthetic database: each simulated canvasser logs in with a
+turf code, then opens their turf, a door, its voters, and now and then takes
+a note.
+
+    python3 -m car.script.load_benchmark [workers] [seconds] [canvassers]
+
+Needs gunicorn. Workers default to the number of CPUs.
+"""
+
+import http.client
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+# the databases are built in a scratch directory, which the servers then use
+os.environ["CAR_DATA_PATH"] = tempfile.mkdtemp(prefix="car-load-benchmark-")
+
+from ..model import Database, Turf  # noqa: E402
+from .synthetic import synthetic_database  # noqa: E402
+
+N_TURFS = 20
+TURF_DOORS = 100
+PORT = 3031
+NOTE_CHANCE = 0.1
+
+
+def build_database():
+    db = synthetic_database(N_TURFS * TURF_DOORS * 2)
+    for i in range(N_TURFS):
+        door_ids = list(range(i * TURF_DOORS, (i + 1) * TURF_DOORS))
+        db.turfs.append(
+            Turf(
+                _id=len(db.turfs),
+                created_by="system",
+                desc=f"turf {i}",
+                login_code=f"{3000000000 + i}",
+                doors=door_ids,
+                voters=[v for d in door_ids for v in db.doors[d].voters],
+            )
+        )
+
+    db.checkpoint(backup=False)
+
+
+class Canvasser:
+    def __init__(self, name: str, turf: Turf, rng: random.Random):
+        self.name = name
+        self.turf = turf
+        self.rng = rng
+        self.conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=30)
+        self.cookie = ""
+        self.requests = 0
+        self.errors = 0
+
+    def request(self, method: str, url: str, form: dict[str, str] | None = None):
+        headers = {"Cookie": self.cookie}
+        body = None
+        if form is not None:
+            body = urllib.parse.urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+        self.conn.request(method, url, body, headers)
+        response = self.conn.getresponse()
+        response.read()
+        if cookie := response.getheader("Set-Cookie"):
+            self.cookie = cookie.split(";", 1)[0]
+
+        self.requests += 1
+        if response.status >= 400:
+            self.errors += 1
+
+    def visit(self):
+        db = Database.get()
+        self.request("GET", f"/turf/{self.turf.id}/")
+        door_id = self.rng.choice(self.turf.doors)
+        self.request("GET", f"/door/{door_id}/")
+        for voter_id in db.doors[door_id].voters:
+            self.request("GET", f"/voter/{voter_id}/")
+            if self.rng.random() < NOTE_CHANCE:
+                form = {"disposition": "refused", "note": f"from {self.name}"}
+                self.request("POST", f"/voter/{voter_id}/note/", form)
+
+    def run(self, until: float):
+        self.request(
+            "POST",
+            "/login/",
+            {"password": self.turf.login_code, "canvasser": self.name},
+        )
+        while time.monotonic() < until:
+            self.visit()
+
+
+def wait_for_port(proc: subprocess.Popen):
+    for _ in range(300):
+        if proc.poll() is not None:
+            raise SystemExit("gunicorn exited; is it installed?")
+        try:
+            socket.create_connection(("127.0.0.1", PORT), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+
+    raise SystemExit("gunicorn didn't start")
+
+
+def run(workers: int, seconds: float, n_canvassers: int) -> tuple[int, int]:
+    env = os.environ | {"CAR_WORKERS": str(workers)}
+    proc = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-b",
+            f"127.0.0.1:{PORT}",
+            "-w",
+            str(workers),
+            "-k",
+            "gthread",
+            "--threads",
+            "8",
+            "car.app:app",
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(proc)
+        db = Database.get()
+        canvassers = [
+            Canvasser(f"canvasser {i}", db.turfs[1 + i % N_TURFS], random.Random(i))
+            for i in range(n_canvassers)
+        ]
+        until = time.monotonic() + seconds
+        threads = [threading.Thread(target=c.run, args=(until,)) for c in canvassers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    return sum(c.requests for c in canvassers), sum(c.errors for c in canvassers)
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count() or 1
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    n_canvassers = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+
+    build_database()
+
+    for n in sorted({1, workers}):
+        requests, errors = run(n, seconds, n_canvassers)
+        print(
+            f"{n:3} workers: {requests / seconds:8.1f} req/s"
+            f" ({requests} requests, {errors} errors)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Compare the memory used by voters and doors stored as pydantic objects
+(the default) and in CAR_COMPACT column storage.
+
+    python3 -m car.script.memory_report [n_voters]
+"""
+
+import gc
+import sys
+import time
+import tracemalloc
+
+from .synthetic import synthetic_database
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    t_start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - t_start
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def main():
+    n_voters = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+
+    print(f"building {n_voters} synthetic voters...")
+    db, objects_size, _ = measure(lambda: synthetic_database(n_voters))
+    n_doors = len(db.doors)
+
+    del db
+
+    def build_compact():
+        compact_db = synthetic_database(n_voters)
+        compact_db.compact()
+        return compact_db
+
+    db, compact_size, elapsed = measure(build_compact)
+
+    print(f"{n_voters} voters, {n_doors} doors")
+    print(
+        f"objects: {objects_size / 2**20:8.1f} MiB"
+        f" ({objects_size / n_voters:6.0f} bytes/voter)"
+    )
+    print(
+        f"compact: {compact_size / 2**20:8.1f} MiB"
+        f" ({compact_size / n_voters:6.0f} bytes/voter)"
+        f", built in {elapsed:.1f}s"
+    )
+
+    t_start = time.perf_counter()
+    for idx in range(0, n_voters, max(1, n_voters // 10_000)):
+        db.voters[idx]
+    per_access = (time.perf_counter() - t_start) / min(10_000, n_voters)
+    print(f"materializing a compact voter: {per_access * 1e6:.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
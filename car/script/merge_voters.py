@@ -0,0 +1,56 @@
+"""Merge a voter file into the live database, instead of replacing it: voters
+and doors already there keep their ids, turfs and notes.
+
+    python3 -m car.script.merge_voters sos|l2 <voter file>
+"""
+
+import sys
+
+from ..importer import merge_voter_file
+from ..model import Database, NoteDatabase
+from ..storage import WRITE_LOCK
+from .import_l2_voters import TARGETING_DATA_OUT, L2VoterFile
+from .import_voters import TARGETING_DATA_FILE, SOSVoterFile
+
+SUMMARY = (
+    "rows",
+    "skipped",
+    "voters added",
+    "voters updated",
+    "voters moved",
+    "voters unchanged",
+    "voters removed",
+    "voters returned",
+    "doors added",
+    "doors updated",
+)
+
+
+def main():
+    if len(sys.argv) != 3 or sys.argv[1] not in ("sos", "l2"):
+        print(__doc__)
+        sys.exit(1)
+
+    fmt, path = sys.argv[1:]
+    if fmt == "sos":
+        source = SOSVoterFile(path, TARGETING_DATA_FILE)
+    else:
+        source = L2VoterFile(path, TARGETING_DATA_OUT)
+
+    # the app waits for the merge, rather than commit halfway through it
+    with WRITE_LOCK:
+        database = Database.get()
+        stats = merge_voter_file(database, source)
+
+        for key in SUMMARY:
+            print(f"{key}: {stats[key]:,}")
+        for key, count in sorted(stats.items()):
+            if key.startswith("changed "):
+                print(f"  {key}: {count:,}")
+
+        database.commit()
+        NoteDatabase.get().commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+"""Copy both databases into another storage engine, e.g.
+
+    CAR_STORAGE=json python3 -m car.script.migrate_storage sqlite
+
+then restart the app with CAR_STORAGE=sqlite."""
+
+import sys
+
+from ..model import Database, NoteDatabase
+from ..storage import ENGINES
+
+target = ENGINES[sys.argv[1]]()
+
+for cls in (Database, NoteDatabase):
+    db = cls.get()
+    target.checkpoint(db, backup=False)
+    print(f"migrated {cls.DATABASE_FILE_NAME} to {sys.argv[1]}")
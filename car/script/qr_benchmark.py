@@ -0,0 +1,54 @@
+"""Compare pairing QR code generation in-process (segno, cold and cached)
+with the old qrencode subprocess, if qrencode is installed.
+
+    python3 -m car.script.qr_benchmark [requests]
+"""
+
+import secrets
+import shutil
+import subprocess
+import sys
+import time
+
+from .. import utils
+
+
+def qrencode(uri):
+    proc = subprocess.Popen(
+        "qrencode -t png -o- | base64 -w0",
+        shell=True,
+        text=True,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    out, _ = proc.communicate(uri)
+    return f"data:image/png;base64,{out}"
+
+
+def timed(f, uris):
+    t_start = time.perf_counter()
+    for uri in uris:
+        f(uri)
+    return (time.perf_counter() - t_start) / len(uris)
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    uris = [
+        f"https://car.example.org/pair_phone/{secrets.token_hex()}/"
+        for _ in range(requests)
+    ]
+
+    results = {"in-process": timed(utils.qr_code, uris)}
+    results["in-process, cached"] = timed(utils.qr_code, uris[-100:])
+    if shutil.which("qrencode"):
+        results["qrencode subprocess"] = timed(qrencode, uris)
+    else:
+        print("qrencode isn't installed, skipping the subprocess path")
+
+    for name, seconds in results.items():
+        print(f"{name:22} {seconds * 1000:8.3f} ms per code")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Compare voter name search through NameIndex with the old full scan on a
+synthetic voter file.
+
+    python3 -m car.script.search_benchmark [n_voters]
+"""
+
+import itertools
+import sys
+import time
+
+from ..search import NameIndex
+from .synthetic import synthetic_database
+
+QUERIES = [
+    "smith",  # common
+    "mary smith12",  # common first name, rare last name
+    "williams996",  # rare
+    "jo",  # short, matches lots
+    "zzyzx",  # absent
+]
+
+
+def scan(db, query, limit=20):
+    parts = query.strip().lower().split()
+
+    def matches_voter(v):
+        return all(
+            part in " ".join(map(str, [v.firstname, v.lastname])).lower()
+            for part in parts
+        )
+
+    return [v.id for v in itertools.islice(filter(matches_voter, db.voters), limit)]
+
+
+def timed(f, query, repeat):
+    t_start = time.perf_counter()
+    for _ in range(repeat):
+        f(query)
+    return (time.perf_counter() - t_start) / repeat
+
+
+def main():
+    n_voters = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+
+    print(f"building {n_voters} synthetic voters...")
+    db = synthetic_database(n_voters)
+
+    t_start = time.perf_counter()
+    index = NameIndex(db)
+    print(f"index built in {time.perf_counter() - t_start:.1f}s")
+
+    for query in QUERIES:
+        # same matches as the scan, just ranked
+        everything = set(index.search(query, limit=n_voters))
+        assert everything == set(scan(db, query, limit=n_voters)), query
+
+        scan_time = timed(lambda q: scan(db, q), query, 3)
+        index_time = timed(index.search, query, 20)
+        print(
+            f"{query!r:16} {len(everything):7} matches:"
+            f" scan {scan_time * 1000:8.2f} ms, index {index_time * 1000:8.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
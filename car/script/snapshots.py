@@ -0,0 +1,44 @@
+"""List, restore and prune database snapshots.
+
+    python3 -m car.script.snapshots list [database|note-database]
+    python3 -m car.script.snapshots restore <snapshot id>
+    python3 -m car.script.snapshots prune
+
+A running app picks a restored database up like an imported one."""
+
+import sys
+
+from ..model import Database, NoteDatabase
+from ..storage import WRITE_LOCK, get_snapshot_store
+
+DATABASES = {cls.DATABASE_FILE_NAME: cls for cls in (Database, NoteDatabase)}
+
+
+def main():
+    store = get_snapshot_store()
+    match sys.argv[1:]:
+        case ["list", *name]:
+            for manifest in store.list_snapshots(*name):
+                n_chunks = sum(map(len, manifest["chunks"].values()))
+                print(f"{manifest['id']}\t{n_chunks} chunks")
+
+        case ["restore", snapshot_id]:
+            dump = store.restore(snapshot_id)
+            cls = DATABASES[store.manifest(snapshot_id)["database"]]
+            # a new generation, so nothing journaled since the snapshot was
+            # taken gets replayed onto it
+            with WRITE_LOCK:
+                cls.model_validate(dump | {"generation": ""}).checkpoint(backup=True)
+            print(f"restored {snapshot_id}")
+
+        case ["prune"]:
+            for snapshot_id in store.prune():
+                print(f"removed {snapshot_id}")
+
+        case _:
+            print(__doc__)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
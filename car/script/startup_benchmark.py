@@ -0,0 +1,56 @@
+"""Time app startups on a synthetic database, in fresh processes: with the
+load cache turned off, with it missing (so it gets written), and with it in
+place. Each prints its startup report.
+
+    python3 -m car.script.startup_benchmark [n_voters]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+# the app works out of $CAR_DATA_PATH, so point it at a scratch directory
+# before anything loads the databases
+os.environ["CAR_DATA_PATH"] = tempfile.mkdtemp(prefix="car-startup-benchmark-")
+os.environ.setdefault("CAR_ADMIN_PASSWORD", "benchmark")
+
+from .. import loadcache  # noqa: E402
+from ..model import Database, NoteDatabase  # noqa: E402
+from .synthetic import synthetic_database  # noqa: E402
+
+START_APP = (
+    "import logging; logging.basicConfig(level=logging.INFO, format='%(message)s');"
+    " from car.app import app; app.test_client().get('/login/')"
+)
+
+
+def start(label: str, **env: str):
+    result = subprocess.run(
+        [sys.executable, "-c", START_APP],
+        env=os.environ | env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    report = [
+        line for line in result.stderr.splitlines() if line.startswith("startup:")
+    ]
+    print(f"{label}:", *report)
+
+
+def main():
+    n_voters = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+
+    synthetic_database(n_voters).checkpoint(backup=False)
+    NoteDatabase.get().checkpoint(backup=False)
+
+    start("no load cache", CAR_LOAD_CACHE="0")
+    for cls in (Database, NoteDatabase):
+        os.remove(loadcache.cache_file(cls))
+    start("load cache missing")
+    start("load cache")
+
+
+if __name__ == "__main__":
+    main()
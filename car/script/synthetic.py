@@ -0,0 +1,90 @@
+"""Synthetic databases for benchmarks and memory reports."""
+
+import random
+
+from ..model import Database, Door, Turf, Voter
+
+STREETS = ["MAIN ST", "OAK AVE", "PINE ST", "ELM DR", "CEDAR LN", "MAPLE AVE"]
+CITIES = ["MONTGOMERY", "PRATTVILLE", "MILLBROOK", "WETUMPKA"]
+FIRSTNAMES = ["JAMES", "MARY", "JOHN", "PATRICIA", "ROBERT", "JENNIFER", "MICHAEL"]
+LASTNAMES = ["SMITH", "JOHNSON", "WILLIAMS", "BROWN", "JONES", "GARCIA", "MILLER"]
+
+
+def synthetic_voter(rng: random.Random, id: int, door_id: int) -> Voter:
+    phone = f"(334) {rng.randint(200, 999)}-{rng.randint(0, 9999):04d}"
+    return Voter(
+        _id=id,
+        created_by="system import",
+        door_id=door_id,
+        statevoterid=f"{100000000 + id}",
+        activeinactive=rng.choice("AAAAI"),
+        firstname=rng.choice(FIRSTNAMES),
+        middlename=rng.choice(FIRSTNAMES),
+        lastname=f"{rng.choice(LASTNAMES)}{id % 997}",
+        cellphone=phone if rng.random() < 0.5 else "",
+        landlinephone=phone,
+        gender=rng.choice("MFU"),
+        race=rng.choice("WBHAO"),
+        party=rng.choice(["Strong Democrat", "Weak Republican", "Independent"]),
+        birthdate=f"{rng.randint(1930, 2006)}-01-01",
+        regdate=f"{rng.randint(1960, 2025)}-01-01",
+        bestphone=phone,
+    )
+
+
+def synthetic_door(rng: random.Random, id: int) -> Door:
+    return Door(
+        _id=id,
+        created_by="voter import",
+        address=f"{100 + id % 900} {STREETS[id // 900 % len(STREETS)]} {id // 5400}",
+        unit=f"APT {id % 7}" if id % 11 == 0 else "",
+        city=rng.choice(CITIES),
+        lat=32.3 + rng.random() / 10,
+        lon=-86.3 + rng.random() / 10,
+    )
+
+
+def synthetic_database(
+    n_voters: int, voters_per_door: int = 2, turf_size: int = 0, seed: int = 0
+) -> Database:
+    """A database of `n_voters` voters spread over doors, with an "All Voters"
+    phonebank turf (id 0) and, if `turf_size` is set, canvassing turfs of
+    `turf_size` consecutive doors each"""
+    rng = random.Random(seed)
+    db = Database()
+
+    n_doors = max(1, n_voters // voters_per_door)
+    for door_id in range(n_doors):
+        db.doors.append(synthetic_door(rng, door_id))
+
+    for voter_id in range(n_voters):
+        door_id = voter_id % n_doors
+        db.voters.append(synthetic_voter(rng, voter_id, door_id))
+        db.doors[door_id].voters.append(voter_id)
+
+    db.turfs.append(
+        Turf(
+            _id=0,
+            created_by="system",
+            desc="All Voters",
+            phone_key="default",
+            login_code="1000000000",
+            voters=list(range(n_voters)),
+        )
+    )
+
+    if turf_size:
+        for start in range(0, n_doors, turf_size):
+            door_ids = list(range(start, min(start + turf_size, n_doors)))
+            db.turfs.append(
+                Turf(
+                    _id=len(db.turfs),
+                    created_by="system",
+                    desc=f"Turf {len(db.turfs)}",
+                    login_code=f"{2000000000 + len(db.turfs)}",
+                    doors=door_ids,
+                    voters=[v for d in door_ids for v in db.doors[d].voters],
+                )
+            )
+
+    return db
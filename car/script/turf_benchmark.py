@@ -0,0 +1,106 @@
+"""Time turf page requests (normal and print view) for turfs of 50, 500 and
+5,000 doors on a synthetic database, with the turf started and about a third
+of the voters dispositioned: rendered, from the fragment cache, and
+revalidated by ETag.
+
+    python3 -m car.script.turf_benchmark [requests per page]
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# the app works out of $CAR_DATA_PATH, so point it at a scratch directory
+# before anything loads the databases
+os.environ["CAR_DATA_PATH"] = tempfile.mkdtemp(prefix="car-turf-benchmark-")
+os.environ.setdefault("CAR_ADMIN_PASSWORD", "benchmark")
+
+from ..model import Database, Note, NoteDatabase, Turf  # noqa: E402
+from .synthetic import synthetic_database  # noqa: E402
+
+TURF_SIZES = [50, 500, 5000]
+
+
+def build_database():
+    db = synthetic_database(sum(TURF_SIZES) * 2)
+    start = 0
+    for size in TURF_SIZES:
+        door_ids = list(range(start, start + size))
+        db.turfs.append(
+            Turf(
+                _id=len(db.turfs),
+                created_by="system",
+                desc=f"{size} doors",
+                login_code=f"{3000000000 + size}",
+                doors=door_ids,
+                voters=[v for d in door_ids for v in db.doors[d].voters],
+            )
+        )
+        start += size
+
+    db.checkpoint(backup=False)
+
+    rng = random.Random(0)
+    note_db = NoteDatabase.get()
+    for turf in db.turfs[1:]:
+        turf.add_note(Note(note="started", disposition="in-progress"))
+
+    for voter in db.voters:
+        if rng.random() < 0.3:
+            voter.add_note(
+                Note(note="", disposition=rng.choice(["refused", "followup", "done"]))
+            )
+
+    note_db.checkpoint(backup=False)
+
+
+def main():
+    n_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    build_database()
+
+    from ..app import app, fragment_cache
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["canvasser"] = "benchmark"
+        session["admin"] = True
+
+    def timed(url, status, headers=None, before=None):
+        times = []
+        for _ in range(n_requests):
+            if before:
+                before()
+            t_start = time.perf_counter()
+            response = client.get(url, headers=headers)
+            times.append(time.perf_counter() - t_start)
+            assert response.status_code == status, response.status_code
+
+        return statistics.median(times), response
+
+    db = Database.get()
+    for turf in db.turfs[1:]:
+        for label, url in [
+            ("page", f"/turf/{turf.id}/"),
+            ("print", f"/turf/{turf.id}/?print"),
+        ]:
+            rendered, _ = timed(url, 200, before=fragment_cache.data.clear)
+            # e.g. another canvasser on the same turf
+            cached, response = timed(url, 200)
+            # the same page again, when the browser already has it
+            headers = {"If-None-Match": response.headers["ETag"]}
+            not_modified, _ = timed(url, 304, headers=headers)
+
+            print(
+                f"{len(turf.doors):5} doors, {label:5}:"
+                f" {rendered * 1000:8.1f} ms rendered,"
+                f" {cached * 1000:8.1f} ms from fragment cache,"
+                f" {not_modified * 1000:8.1f} ms for a 304 (medians)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ import sqlite3
 import subprocess
 
 from ..model import ID, Database, Turf, has_geocode
+from ..storage import WRITE_LOCK
 
 TURF_DATA_PATH = os.getenv("TURF_DATA_PATH", "")
 TURF_GROUP_ID = os.getenv("TURF_GROUP")
@@ -15,9 +16,9 @@ database = Database.get()
 
 
 def get_turf_group():
-    for group in database.groups:
-        if group.external_id == TURF_GROUP_ID:
-            return group
+    group_id = database.lookup("group_external_id", TURF_GROUP_ID)
+    if group_id is not None:
+        return database.groups[group_id]
 
 
 def sync_turf_props():
@@ -76,7 +77,7 @@ def sync_turf_props():
     conn.close()
 
 
-def set_voter_turfs():
+def join_doors_to_turfs():
     subprocess.call(
         [
             # --distance_units=meters --area_units=m2 --ellipsoid=EPSG:7030
@@ -93,6 +94,8 @@ def set_voter_turfs():
         ]
     )
 
+
+def set_voter_turfs():
     turf_group = get_turf_group()
     assert turf_group
 
@@ -208,9 +211,14 @@ def assign_login_codes():
 
 if __name__ == "__main__":
     assert TURF_DATA_PATH, "$TURF_DATA_PATH not set"
-    sync_turf_props()
-    set_voter_turfs()
-    database.fixup_backrefs()
-    # reorder_all_doors()
-    assign_login_codes()
-    database.commit()
+    # the app's writes wait for ours, and ours start from everything it
+    # committed; but not for as long as qgis takes
+    with WRITE_LOCK:
+        sync_turf_props()
+    join_doors_to_turfs()
+    with WRITE_LOCK:
+        set_voter_turfs()
+        database.fixup_backrefs()
+        # reorder_all_doors()
+        assign_login_codes()
+        database.commit()
@@ -0,0 +1,180 @@
+"""In-memory search indexes over voters and doors, kept up to date through
+Database.subscribe."""
+
+import bisect
+import heapq
+from collections import defaultdict
+from collections.abc import Iterable
+from typing import Any
+
+from .model import ID, Database, Door, Model, Voter, normalize_address
+
+# how well a query token matches a name token, for ranking
+EXACT, PREFIX, SUBSTRING = 2, 1, 0
+
+
+def _trigrams(s: str) -> set[str]:
+    return {s[i : i + 3] for i in range(len(s) - 2)}
+
+
+def _quality(part: str, name: str) -> int:
+    if name == part:
+        return EXACT
+    if name.startswith(part):
+        return PREFIX
+    return SUBSTRING
+
+
+class TokenIndex[T: Model]:
+    """Records by the tokens of some of their fields. A query matches records
+    where every query token is a substring of one of the record's tokens;
+    results rank exact token matches over prefixes over other substrings,
+    then by id.
+
+    Records are indexed by token in sorted id lists, and tokens by trigram,
+    so a query only looks at the (far fewer) distinct tokens containing its
+    trigrams, and can stop as soon as it has enough results that nothing
+    later could outrank. Query tokens shorter than three characters fall back
+    to scanning the distinct tokens."""
+
+    COLLECTION: str
+
+    def __init__(self, db: Database):
+        self.db = db
+        self.rebuild()
+        db.subscribe(self._on_change)
+
+    def tokens(self, record: T) -> list[str]:
+        raise NotImplementedError
+
+    def query_tokens(self, query: str) -> list[str]:
+        raise NotImplementedError
+
+    def rebuild(self):
+        self._records: defaultdict[str, list[ID]] = defaultdict(list)
+        self._grams: defaultdict[str, set[str]] = defaultdict(set)
+        self._record_tokens: dict[ID, tuple[str, ...]] = {}
+
+        for record in getattr(self.db, self.COLLECTION):
+            self._add(record)
+
+    def _add(self, record: T):
+        tokens = tuple(dict.fromkeys(self.tokens(record)))
+        self._record_tokens[record.id] = tokens
+        for token in tokens:
+            if token not in self._records:
+                for gram in _trigrams(token):
+                    self._grams[gram].add(token)
+
+            ids = self._records[token]
+            if not ids or ids[-1] < record.id:
+                ids.append(record.id)
+            else:
+                bisect.insort(ids, record.id)
+
+    def _remove(self, id: ID):
+        for token in self._record_tokens.pop(id, ()):
+            ids = self._records[token]
+            ids.remove(id)
+            if not ids:
+                del self._records[token]
+                for gram in _trigrams(token):
+                    self._grams[gram].discard(token)
+
+    def _on_change(self, entry: dict[str, Any]):
+        match entry:
+            case {"op": "reset"}:
+                self.rebuild()
+
+            case {"op": "put", "collection": self.COLLECTION, "id": id}:
+                record = getattr(self.db, self.COLLECTION)[id]
+                tokens = tuple(dict.fromkeys(self.tokens(record)))
+                if self._record_tokens.get(id) != tokens:
+                    self._remove(id)
+                    self._add(record)
+
+    def _matching_tokens(self, part: str) -> Iterable[str]:
+        if len(part) < 3:
+            return [token for token in self._records if part in token]
+
+        grams = sorted(
+            (self._grams.get(gram, set()) for gram in _trigrams(part)), key=len
+        )
+        candidates = set.intersection(*grams) if grams[0] else set()
+        return [token for token in candidates if part in token]
+
+    def search(self, query: str, limit: int = 20) -> list[ID]:
+        parts = sorted(self.query_tokens(query), key=len, reverse=True)
+        if not parts:
+            return []
+
+        # look the longest token up in the index, as it tends to narrow things
+        # down the most, then check the rest against each record's tokens
+        first, rest = parts[0], parts[1:]
+        tiers: dict[int, list[list[ID]]] = {EXACT: [], PREFIX: [], SUBSTRING: []}
+        for token in self._matching_tokens(first):
+            tiers[_quality(first, token)].append(self._records[token])
+
+        results: list[tuple[int, ID]] = []  # min-heap of the best (score, -id)
+        seen: set[ID] = set()
+
+        def full() -> bool:
+            # once we have `limit` results scoring better than the tier can
+            # do, nothing after can beat them (a tie could, with a lower id
+            # from a later tier)
+            return len(results) == limit and results[0][0] > best_possible
+
+        for quality in (EXACT, PREFIX, SUBSTRING):
+            best_possible = quality + EXACT * len(rest)
+            if full():
+                break
+
+            for id in heapq.merge(*tiers[quality]):
+                if id in seen:
+                    continue
+                seen.add(id)
+
+                score = quality
+                for part in rest:
+                    qualities = [
+                        _quality(part, token)
+                        for token in self._record_tokens[id]
+                        if part in token
+                    ]
+                    if not qualities:
+                        break
+                    score += max(qualities)
+                else:
+                    if len(results) < limit:
+                        heapq.heappush(results, (score, -id))
+                    elif (score, -id) > results[0]:
+                        heapq.heapreplace(results, (score, -id))
+
+                if full():
+                    break
+
+        return [-neg_id for _, neg_id in sorted(results, reverse=True)]
+
+
+class NameIndex(TokenIndex[Voter]):
+    """Voters by first and last name"""
+
+    COLLECTION = "voters"
+
+    def tokens(self, record: Voter) -> list[str]:
+        return f"{record.firstname} {record.lastname}".lower().split()
+
+    def query_tokens(self, query: str) -> list[str]:
+        return query.lower().split()
+
+
+class AddressIndex(TokenIndex[Door]):
+    """Doors by normalized address, unit and city"""
+
+    COLLECTION = "doors"
+
+    def tokens(self, record: Door) -> list[str]:
+        return " ".join(record.normalized_address()).split()
+
+    def query_tokens(self, query: str) -> list[str]:
+        return normalize_address(query).split()
@@ -0,0 +1,227 @@
+"""Content-addressed database snapshots.
+
+A snapshot is a small manifest pointing at gzipped JSON chunks stored under
+their sha256, so chunks that didn't change between snapshots are shared.
+Record collections are chunked by ID range and note collections by a hash
+of the note key, so one edited voter or one new note only adds one chunk.
+
+Several processes (workers, the snapshots CLI) can share a store: taking a
+snapshot holds a shared flock on `lock`, and pruning an exclusive one, so
+chunks aren't collected between a snapshot finding them on disk and
+writing the manifest that refers to them.
+"""
+
+import contextlib
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+import zlib
+from collections.abc import Generator, Iterable
+from datetime import datetime, timedelta
+from typing import Any
+
+RECORDS_PER_CHUNK = 256
+NOTE_BUCKETS = 256
+# maybe_prune() prunes at most this often
+PRUNE_INTERVAL_SECS = 600
+
+# snapshot ids are f"{database}-{created.isoformat()}"
+SNAPSHOT_ID = re.compile(r"(.+)-(\d{4}-\d\d-\d\dT[\d:.]+)")
+
+
+def _canonical(x: Any) -> bytes:
+    return json.dumps(x, sort_keys=True, separators=(",", ":")).encode()
+
+
+class SnapshotStore:
+    def __init__(self, root: str):
+        self.root = root
+        self.objects = os.path.join(root, "objects")
+        self.manifests = os.path.join(root, "manifests")
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects, digest[:2], f"{digest}.json.gz")
+
+    def _put(self, chunk: Any) -> str:
+        data = _canonical(chunk)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        # (on disk, not remembered: another process may have pruned it)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f"{path}.{os.getpid()}.tmp", "wb") as f:
+                f.write(gzip.compress(data))
+            os.rename(f"{path}.{os.getpid()}.tmp", path)
+
+        return digest
+
+    @contextlib.contextmanager
+    def _locked(self, op: int) -> Generator[None, None, None]:
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, "lock"), "a") as f:
+            fcntl.flock(f, op)
+            yield
+
+    def _get(self, digest: str) -> Any:
+        with open(self._object_path(digest), "rb") as f:
+            return json.loads(gzip.decompress(f.read()))
+
+    def take(self, name: str, dump: dict[str, Any]) -> str:
+        """Snapshot a database dump (`model_dump(mode="json", by_alias=True)`)
+        and return the snapshot id"""
+        with self._locked(fcntl.LOCK_SH):
+            return self._take(name, dump)
+
+    def _take(self, name: str, dump: dict[str, Any]) -> str:
+        chunks: dict[str, list[str]] = {}
+        buckets: dict[str, list[str]] = {}
+        values: dict[str, Any] = {}
+
+        for field, value in dump.items():
+            if isinstance(value, list):
+                chunks[field] = [
+                    self._put(value[i : i + RECORDS_PER_CHUNK])
+                    for i in range(0, len(value), RECORDS_PER_CHUNK)
+                ]
+
+            elif isinstance(value, dict):
+                split: list[dict[str, Any]] = [{} for _ in range(NOTE_BUCKETS)]
+                for key, item in value.items():
+                    split[zlib.crc32(key.encode()) % NOTE_BUCKETS][key] = item
+
+                buckets[field] = [self._put(bucket) for bucket in split]
+
+            else:
+                values[field] = value
+
+        created = datetime.now()
+        snapshot_id = f"{name}-{created.isoformat()}"
+        os.makedirs(self.manifests, exist_ok=True)
+        with open(os.path.join(self.manifests, f"{snapshot_id}.json"), "w") as f:
+            json.dump(
+                {
+                    "database": name,
+                    "created": created.isoformat(),
+                    "chunks": chunks,
+                    "buckets": buckets,
+                    "values": values,
+                },
+                f,
+            )
+
+        return snapshot_id
+
+    def manifest(self, snapshot_id: str) -> dict[str, Any]:
+        with open(os.path.join(self.manifests, f"{snapshot_id}.json")) as f:
+            return json.load(f)
+
+    def list_snapshots(self, name: str | None = None) -> list[dict[str, Any]]:
+        """Snapshot manifests, oldest first"""
+        if not os.path.isdir(self.manifests):
+            return []
+
+        result = []
+        for file in os.listdir(self.manifests):
+            if not file.endswith(".json"):
+                continue
+
+            manifest = self.manifest(file.removesuffix(".json"))
+            if name is None or manifest["database"] == name:
+                result.append({"id": file.removesuffix(".json")} | manifest)
+
+        result.sort(key=lambda m: m["created"])
+        return result
+
+    def restore(self, snapshot_id: str) -> dict[str, Any]:
+        """Rebuild the database dump a snapshot was taken from"""
+        manifest = self.manifest(snapshot_id)
+        dump: dict[str, Any] = dict(manifest["values"])
+
+        for field, digests in manifest["chunks"].items():
+            dump[field] = [item for digest in digests for item in self._get(digest)]
+
+        for field, digests in manifest["buckets"].items():
+            dump[field] = {}
+            for digest in digests:
+                dump[field].update(self._get(digest))
+
+        return dump
+
+    def maybe_prune(self) -> list[str]:
+        """prune(), if nobody has for PRUNE_INTERVAL_SECS"""
+        marker = os.path.join(self.root, "pruned")
+        try:
+            if time.time() - os.path.getmtime(marker) < PRUNE_INTERVAL_SECS:
+                return []
+        except FileNotFoundError:
+            pass
+
+        removed = self.prune()
+        with open(marker, "w"):
+            pass
+        return removed
+
+    def prune(self, now: datetime | None = None) -> list[str]:
+        """Apply the retention policy: keep every snapshot from the last hour,
+        the newest per hour for the last day, and the newest per day before
+        that. Returns the ids of the removed snapshots."""
+        with self._locked(fcntl.LOCK_EX):
+            return self._prune(now or datetime.now())
+
+    def _prune(self, now: datetime) -> list[str]:
+        if not os.path.isdir(self.manifests):
+            return []
+
+        # (database, created, id), from the file names rather than reading
+        # every manifest
+        snapshots = []
+        for file in os.listdir(self.manifests):
+            snapshot_id = file.removesuffix(".json")
+            if file.endswith(".json") and (m := SNAPSHOT_ID.fullmatch(snapshot_id)):
+                name, created = m.groups()
+                snapshots.append((name, datetime.fromisoformat(created), snapshot_id))
+        snapshots.sort(key=lambda s: s[1])
+
+        keep: set[str] = set()
+        seen_buckets: set[tuple[str, str]] = set()
+        for name, created, snapshot_id in reversed(snapshots):
+            if now - created < timedelta(hours=1):
+                keep.add(snapshot_id)
+                continue
+
+            if now - created < timedelta(days=1):
+                bucket = created.strftime("%Y-%m-%d %H")
+            else:
+                bucket = created.strftime("%Y-%m-%d")
+
+            if (name, bucket) not in seen_buckets:
+                seen_buckets.add((name, bucket))
+                keep.add(snapshot_id)
+
+        removed = [id for _, _, id in snapshots if id not in keep]
+        for snapshot_id in removed:
+            os.remove(os.path.join(self.manifests, f"{snapshot_id}.json"))
+
+        if removed:
+            self._collect_garbage(self.manifest(id) for id in sorted(keep))
+
+        return removed
+
+    def _collect_garbage(self, manifests: Iterable[dict[str, Any]]):
+        referenced: set[str] = set()
+        for manifest in manifests:
+            for digests in [
+                *manifest["chunks"].values(),
+                *manifest["buckets"].values(),
+            ]:
+                referenced.update(digests)
+
+        for prefix in os.listdir(self.objects):
+            for file in os.listdir(os.path.join(self.objects, prefix)):
+                digest = file.removesuffix(".json.gz")
+                if digest not in referenced:
+                    os.remove(os.path.join(self.objects, prefix, file))
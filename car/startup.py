@@ -0,0 +1,68 @@
+"""Where the app's cold start goes: importing, loading (and validating, or
+reading the load cache for) each database, building indexes, and serving
+the first request. Logged once that first request is done."""
+
+import contextlib
+import logging
+import time
+from collections.abc import Generator
+
+from . import IMPORT_STARTED
+
+logger = logging.getLogger(__name__)
+
+# phase -> seconds, not counting phases nested inside it
+TIMINGS: dict[str, float] = {}
+# seconds spent in nested phases, for each phase being timed
+_nested: list[float] = []
+_ready_after: float | None = None
+_reported = False
+
+
+@contextlib.contextmanager
+def timed(phase: str) -> Generator[None, None, None]:
+    if _reported:
+        yield
+        return
+
+    start = time.perf_counter()
+    _nested.append(0.0)
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        nested = _nested.pop()
+        if _nested:
+            _nested[-1] += elapsed
+        TIMINGS[phase] = TIMINGS.get(phase, 0.0) + elapsed - nested
+
+
+def record(phase: str, seconds: float):
+    TIMINGS[phase] = TIMINGS.get(phase, 0.0) + seconds
+
+
+def since_import() -> float:
+    return time.perf_counter() - IMPORT_STARTED
+
+
+def ready():
+    """The app is set up and can take requests"""
+    global _ready_after
+    _ready_after = since_import()
+
+
+def report() -> str:
+    """The timings so far; stops timing anything else"""
+    global _reported
+    _reported = True
+    phases = ", ".join(f"{phase} {secs:.2f}s" for phase, secs in TIMINGS.items())
+    if _ready_after is not None:
+        phases += f" (ready after {_ready_after:.2f}s)"
+    return f"startup: {phases}"
+
+
+def first_request(path: str, seconds: float):
+    """Log the report, including this request, if it hasn't been yet"""
+    if not _reported:
+        record(f"first request ({path})", seconds)
+        logger.info(report())
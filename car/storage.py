@@ -0,0 +1,895 @@
+"""Storage engines behind BaseDatabase.
+
+The `json` engine (the default) keeps each database in one JSON file plus an
+append-only journal of changed records and new notes. The `sqlite` engine
+keeps one row per record in `car.sqlite3`, so journaled changes become
+single-row writes. Pick one with
+$CAR_STORAGE.
+
+Commits go through a CommitCoordinator. In the default `sync` durability
+mode they are written before commit() returns; in `batched` and `async`
+modes commit() only queues the database and a background thread flushes
+everything queued every $CAR_COMMIT_INTERVAL_MS, with `async` also skipping
+fsync. The same thread takes the periodic journal checkpoints and the
+snapshots that go with them. Queued work is done at interpreter exit.
+
+Every process using the data directory (gunicorn workers, with $CAR_WORKERS
+above 1, and scripts run against a live database alike) shares it through
+WRITE_LOCK, which is also an flock on `write.lock`: taking it first catches
+this process up on everyone else's commits, so nobody builds on stale data.
+Queued changes to a record win over others' changes replayed meanwhile, as
+they're written after them; new records, whose ids are positions, are
+written out before letting go of the lock. Readers catch up between
+requests via sync_databases().
+
+A HotReloader thread also watches for databases replaced from outside the
+app (e.g. by an import script) every $CAR_HOT_RELOAD_SECS, loading and
+validating them in the background, so that taking the lock only has to
+swap them in.
+"""
+
+import atexit
+import fcntl
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Any, BinaryIO, get_origin
+
+from . import loadcache, startup
+from .snapshots import SnapshotStore
+
+if TYPE_CHECKING:
+    from .model import BaseDatabase
+
+logger = logging.getLogger(__name__)
+
+DATA_ROOT = os.getenv("CAR_DATA_PATH", ".")
+STORAGE_ENGINE = os.getenv("CAR_STORAGE", "json")
+
+# journaled databases fold their log back into the base file after this many
+# entries, or this many seconds since the last checkpoint, whichever is first
+JOURNAL_CHECKPOINT_ENTRIES = int(os.getenv("CAR_JOURNAL_CHECKPOINT_ENTRIES", "1000"))
+JOURNAL_CHECKPOINT_SECS = int(os.getenv("CAR_JOURNAL_CHECKPOINT_SECS", "3600"))
+
+DURABILITY = os.getenv("CAR_DURABILITY", "sync")
+COMMIT_INTERVAL_MS = int(os.getenv("CAR_COMMIT_INTERVAL_MS", "200"))
+
+WORKERS = int(os.getenv("CAR_WORKERS", "1"))
+MULTIPROCESS = WORKERS > 1
+
+# 0 turns the hot reloader off
+HOT_RELOAD_SECS = float(os.getenv("CAR_HOT_RELOAD_SECS", "2"))
+
+
+class WriteLock:
+    """Reentrant lock held while the in-memory databases are mutated or
+    written out, so the background writer never serializes a half-applied
+    change. When `shared`, the outermost acquire also takes an flock on
+    `path` and runs the on_acquire hooks, and the outermost release runs the
+    on_release hooks before letting go of it."""
+
+    def __init__(self, path: str, shared: bool = True):
+        self.path = path
+        self.shared = shared
+        self.on_acquire: list[Callable[[], None]] = []
+        self.on_release: list[Callable[[], None]] = []
+        self._lock = threading.RLock()
+        self._depth = 0
+        # descriptor of `path`, opened by process `_pid`
+        self._fd = -1
+        self._pid = 0
+
+    def _flock(self, op: int):
+        if self._pid != os.getpid():
+            # a descriptor inherited over fork would share the lock
+            if self._fd >= 0:
+                os.close(self._fd)
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+            self._pid = os.getpid()
+
+        fcntl.flock(self._fd, op)
+
+    def acquire(self):
+        self._lock.acquire()
+        self._depth += 1
+        if self._depth > 1 or not self.shared:
+            return
+
+        try:
+            self._flock(fcntl.LOCK_EX)
+            try:
+                for hook in self.on_acquire:
+                    hook()
+            except BaseException:
+                self._flock(fcntl.LOCK_UN)
+                raise
+        except BaseException:
+            self._depth -= 1
+            self._lock.release()
+            raise
+
+    def release(self):
+        try:
+            if self._depth == 1 and self.shared:
+                try:
+                    for hook in self.on_release:
+                        hook()
+                finally:
+                    self._flock(fcntl.LOCK_UN)
+        finally:
+            self._depth -= 1
+            self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+WRITE_LOCK = WriteLock(os.path.join(DATA_ROOT, "write.lock"))
+
+# DATABASE_FILE_NAME -> the loaded database, for keeping them in sync
+# across workers
+DATABASES: dict[str, "BaseDatabase"] = {}
+
+
+def sync_databases():
+    """Catch up on commits other processes have made"""
+    storage = get_storage()
+    if any(
+        storage.changed(db)
+        # a running hot reloader reads replaced databases without making
+        # requests wait on them
+        and not (get_hot_reloader().running and storage.replaced(db))
+        for db in DATABASES.values()
+    ):
+        # taking the lock does the catching up
+        with WRITE_LOCK:
+            pass
+
+
+def _sync_all():
+    storage = get_storage()
+    reloader = get_hot_reloader()
+    for db in DATABASES.values():
+        if storage.changed(db):
+            reloader.swap_in(storage, db)
+        # (anything committed since the hot reloader read it, too)
+        if storage.changed(db):
+            storage.sync(db)
+
+
+def _flush_new_records():
+    for db in DATABASES.values():
+        if db.has_new_records():
+            db.flush()
+
+
+WRITE_LOCK.on_acquire.append(_sync_all)
+WRITE_LOCK.on_release.append(_flush_new_records)
+
+
+@functools.cache
+def get_snapshot_store() -> SnapshotStore:
+    return SnapshotStore(os.path.join(DATA_ROOT, "snapshot"))
+
+
+def take_snapshot(name: str, dump: dict[str, Any]):
+    store = get_snapshot_store()
+    store.take(name, dump)
+    store.maybe_prune()
+
+
+class Storage:
+    _synced: dict[str, Any]
+
+    def read[D: BaseDatabase](self, cls: type[D]) -> tuple[D, Any]:
+        """Load `cls`, along with the sync state to adopt() if it's used"""
+        raise NotImplementedError
+
+    def adopt(self, cls: type["BaseDatabase"], state: Any):
+        """Track changes to `cls` from the point `state` was read at"""
+        self._synced[cls.DATABASE_FILE_NAME] = state
+
+    def load[D: BaseDatabase](self, cls: type[D]) -> D:
+        db, state = self.read(cls)
+        self.adopt(cls, state)
+        return db
+
+    def commit(self, db: "BaseDatabase", backup: bool = True):
+        """Persist the entries journaled since the last commit"""
+        raise NotImplementedError
+
+    def checkpoint(self, db: "BaseDatabase", backup: bool = True):
+        """Persist the whole database"""
+        raise NotImplementedError
+
+    def checkpoint_due(self, db: "BaseDatabase") -> bool:
+        """Whether `db`'s journal should be folded back into it"""
+        return False
+
+    def changed(self, db: "BaseDatabase") -> bool:
+        """Whether another process has committed to `db` since this one last
+        loaded or synced it"""
+        raise NotImplementedError
+
+    def sync(self, db: "BaseDatabase"):
+        """Apply other processes' commits to `db`, or reload it"""
+        raise NotImplementedError
+
+    def replaced(self, db: "BaseDatabase") -> bool:
+        """Whether catching `db` up means loading it all over again"""
+        raise NotImplementedError
+
+    def fingerprint(self, cls: type["BaseDatabase"]) -> Any:
+        """Something that changes whenever `cls`'s stored data does"""
+        raise NotImplementedError
+
+
+class JSONStorage(Storage):
+    """Other workers' changes show up as a replaced base file (after a
+    checkpoint: reload) or a longer journal (replay the new entries)."""
+
+    def __init__(self):
+        # DATABASE_FILE_NAME -> ((base file, its mtime), journal bytes read).
+        # The base file is kept open, so that a newer one (written within the
+        # same mtime tick) can't get its inode and pass for it.
+        self._synced: dict[str, tuple[tuple[BinaryIO, int], int]] = {}
+
+    @staticmethod
+    def _open_base(cls: type["BaseDatabase"]) -> tuple[BinaryIO, int]:
+        f = open(cls.db_file(), "rb")
+        return f, os.fstat(f.fileno()).st_mtime_ns
+
+    @staticmethod
+    def _base_replaced(cls: type["BaseDatabase"], base: tuple[BinaryIO, int]) -> bool:
+        f, mtime = base
+        st = os.stat(cls.db_file())
+        return not os.path.samestat(os.fstat(f.fileno()), st) or st.st_mtime_ns != mtime
+
+    @staticmethod
+    def _journal_size(db: "BaseDatabase") -> int:
+        try:
+            return os.path.getsize(db.db_journal_file())
+        except FileNotFoundError:
+            return 0
+
+    def read[D: BaseDatabase](self, cls: type[D]) -> tuple[D, Any]:
+        file = cls.db_file()
+        if cls.SHOULD_CREATE and not os.path.exists(file):
+            with open(file, "w") as f:
+                f.write("{}")
+
+        base = self._open_base(cls)
+        data = base[0].read()
+
+        with loadcache.paused_gc():
+            db = None
+            if loadcache.LOAD_CACHE:
+                source_digest = loadcache.digest(data)
+                with startup.timed("load cache"):
+                    db = loadcache.read(cls, source_digest)
+
+            if db is None:
+                with startup.timed("validate"):
+                    db = cls.model_validate_json(data)
+                # before the journal, so the cache matches the file; replaying
+                # keeps them up to date
+                db.rebuild_indexes()
+                if loadcache.LOAD_CACHE:
+                    loadcache.write(db, source_digest)
+
+        offset = self._replay_journal(db, 0) if cls.JOURNALED else 0
+        return db, (base, offset)
+
+    def _replay_journal(self, db: "BaseDatabase", offset: int) -> int:
+        """Apply the journal from byte `offset` on; returns where it ended"""
+        if not os.path.exists(db.db_journal_file()):
+            return 0
+
+        with open(db.db_journal_file(), "rb") as f:
+            f.seek(offset)
+            lines = f.read().splitlines(keepends=True)
+
+        other_generation = 0
+        for line in lines:
+            if not line.endswith(b"\n"):
+                # still being written, or torn at the tail of the log
+                break
+
+            offset += len(line)
+            db._journal_len += 1
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # torn write
+                continue
+
+            if entry["seq"] <= db.journal_seq:
+                continue
+
+            if entry.get("gen", "") != db.generation:
+                # left over from before the base file was replaced
+                other_generation += 1
+                continue
+
+            db.apply(entry)
+            db.journal_seq = entry["seq"]
+
+        _warn_other_generation(db, other_generation)
+        return offset
+
+    def changed(self, db: "BaseDatabase") -> bool:
+        base, offset = self._synced[db.DATABASE_FILE_NAME]
+        return self._base_replaced(type(db), base) or self._journal_size(db) != offset
+
+    def sync(self, db: "BaseDatabase"):
+        name = db.DATABASE_FILE_NAME
+        base, offset = self._synced[name]
+        if self._base_replaced(type(db), base) or self._journal_size(db) < offset:
+            db.reload()
+            return
+
+        self._synced[name] = (base, self._replay_journal(db, offset))
+
+    def replaced(self, db: "BaseDatabase") -> bool:
+        base, offset = self._synced[db.DATABASE_FILE_NAME]
+        return self._base_replaced(type(db), base) or self._journal_size(db) < offset
+
+    def fingerprint(self, cls: type["BaseDatabase"]) -> Any:
+        st = os.stat(cls.db_file())
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def commit(self, db: "BaseDatabase", backup: bool = True):
+        if db._journal:
+            seq = db.journal_seq
+            with open(db.db_journal_file(), "a") as f:
+                for entry in db._journal:
+                    seq += 1
+                    f.write(json.dumps(entry | {"seq": seq}) + "\n")
+                f.flush()
+                if DURABILITY != "async":
+                    os.fsync(f.fileno())
+                offset = f.tell()
+
+            # (if it failed partway, the retry writes the same numbers again,
+            # and replaying skips the repeats)
+            db.journal_seq = seq
+            db._journal_len += len(db._journal)
+            db._journal.clear()
+
+            name = db.DATABASE_FILE_NAME
+            if name in self._synced:
+                self._synced[name] = (self._synced[name][0], offset)
+
+        if self.checkpoint_due(db):
+            get_coordinator().checkpoint_later(db, backup)
+
+    def checkpoint_due(self, db: "BaseDatabase") -> bool:
+        return (
+            db._journal_len >= JOURNAL_CHECKPOINT_ENTRIES
+            or time.time() - db._checkpointed_at >= JOURNAL_CHECKPOINT_SECS
+        )
+
+    def checkpoint(self, db: "BaseDatabase", backup: bool = True):
+        data = db.to_json().encode()
+        with open(db.db_temp_file(), "wb") as f:
+            f.write(data)
+
+        os.rename(db.db_temp_file(), db.db_file())
+        if loadcache.LOAD_CACHE:
+            if db.index_state() is None:
+                db.rebuild_indexes()
+            loadcache.write(db, loadcache.digest(data))
+
+        if backup:
+            # parsed back on the coordinator's thread, outside the lock
+            get_coordinator().snapshot_later(
+                db.DATABASE_FILE_NAME, functools.partial(json.loads, data)
+            )
+
+        # entries are all <= journal_seq now, so a crash before this point
+        # just means they get skipped on the next load
+        db._journal.clear()
+        if os.path.exists(db.db_journal_file()):
+            os.remove(db.db_journal_file())
+
+        db._journal_len = 0
+        db._checkpointed_at = time.time()
+        self._synced[db.DATABASE_FILE_NAME] = (self._open_base(type(db)), 0)
+
+
+def _warn_other_generation(db: "BaseDatabase", skipped: int):
+    if skipped:
+        logger.warning(
+            "skipped %d %s journal entries from another generation",
+            skipped,
+            db.DATABASE_FILE_NAME,
+        )
+
+
+def _collections(cls: type["BaseDatabase"]) -> tuple[list[str], list[str]]:
+    """(record collections, note collections) of a database class"""
+    records: list[str] = []
+    notes: list[str] = []
+    for name, field in cls.model_fields.items():
+        origin = get_origin(field.annotation)
+        if origin is list:
+            records.append(name)
+        elif origin in (dict, defaultdict):
+            notes.append(name)
+
+    return records, notes
+
+
+class SQLiteStorage(Storage):
+    """One table per record collection (`turfs`, `doors`, `voters`, `groups`),
+    keyed by id, and a shared `notes` table. Each row holds the record as
+    JSON; columns listed in the database's INDEXED_FIELDS are generated from
+    it and indexed. The other fields (like `generation`) are kept in `meta`.
+
+    Commits also go into a `changes` table (trimmed to the last CHANGES_KEPT
+    rows) for other processes to replay; a checkpoint leaves a `reload` entry
+    there instead."""
+
+    CHANGES_KEPT = 10000
+
+    def __init__(self, path: str | None = None):
+        self.path = path or os.path.join(DATA_ROOT, "car.sqlite3")
+        self._conn: sqlite3.Connection | None = None
+        self._schemas: set[str] = set()
+        # DATABASE_FILE_NAME -> (PRAGMA data_version, which changes when
+        # another connection commits, and the last `changes` row applied) as
+        # of the last load or sync
+        self._synced: dict[str, tuple[int, int]] = {}
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "PRAGMA synchronous=" + ("OFF" if DURABILITY == "async" else "NORMAL")
+            )
+
+        return self._conn
+
+    def _ensure_schema(self, cls: type["BaseDatabase"]):
+        if cls.DATABASE_FILE_NAME in self._schemas:
+            return
+
+        records, notes = _collections(cls)
+        with self.conn as conn:
+            for name in records:
+                indexed = cls.INDEXED_FIELDS.get(name, ())
+                columns = "".join(
+                    f", {field} GENERATED ALWAYS AS"
+                    f" (json_extract(data, '$.{field}')) VIRTUAL"
+                    for field in indexed
+                )
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {name}"
+                    f" (id INTEGER PRIMARY KEY, data TEXT NOT NULL{columns})"
+                )
+                for field in indexed:
+                    conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS {name}_{field} ON {name}({field})"
+                    )
+
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY,"
+                " db TEXT NOT NULL, entry TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (db TEXT PRIMARY KEY,"
+                " data TEXT NOT NULL)"
+            )
+
+            if notes:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS notes (seq INTEGER PRIMARY KEY,"
+                    " typ TEXT NOT NULL, key TEXT NOT NULL, ts TEXT NOT NULL,"
+                    " data TEXT NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS notes_key ON notes(typ, key)")
+                conn.execute("CREATE INDEX IF NOT EXISTS notes_ts ON notes(ts)")
+
+        self._schemas.add(cls.DATABASE_FILE_NAME)
+
+    def read[D: BaseDatabase](self, cls: type[D]) -> tuple[D, Any]:
+        if not cls.SHOULD_CREATE and not os.path.exists(self.path):
+            raise FileNotFoundError(self.path)
+
+        self._ensure_schema(cls)
+        records, notes = _collections(cls)
+
+        # data_version before reading, so anything committed meanwhile shows
+        # up as a change; the read gets its own connection (and snapshot), as
+        # it may be happening on the hot reloader's thread
+        data_version = self._current_data_version()
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute("BEGIN")
+            (last,) = conn.execute(
+                "SELECT coalesce(max(seq), 0) FROM changes"
+            ).fetchone()
+
+            data: dict[str, Any] = {}
+            for (row,) in conn.execute(
+                "SELECT data FROM meta WHERE db = ?", (cls.DATABASE_FILE_NAME,)
+            ):
+                data.update(json.loads(row))
+
+            for name in records:
+                data[name] = [
+                    json.loads(row)
+                    for (row,) in conn.execute(f"SELECT data FROM {name} ORDER BY id")
+                ]
+
+            for name in notes:
+                data[name] = {}
+
+            if notes:
+                for typ, key, row in conn.execute(
+                    "SELECT typ, key, data FROM notes ORDER BY seq DESC"
+                ):
+                    data[typ].setdefault(key, []).append(json.loads(row))
+        finally:
+            conn.close()
+
+        with loadcache.paused_gc(), startup.timed("validate"):
+            return cls.model_validate(data), (data_version, last)
+
+    def _note_row(self, typ: str, key: str, note: dict[str, Any]):
+        return (typ, key, note["ts"], json.dumps(note))
+
+    def _current_data_version(self) -> int:
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _log_change(self, conn: sqlite3.Connection, db: "BaseDatabase", entry):
+        cursor = conn.execute(
+            "INSERT INTO changes (db, entry) VALUES (?, ?)",
+            (db.DATABASE_FILE_NAME, json.dumps(entry)),
+        )
+        seq = cursor.lastrowid
+        assert seq is not None
+        # (e.g. migrate_storage writes databases it never loaded from here)
+        if db.DATABASE_FILE_NAME in self._synced:
+            data_version, _ = self._synced[db.DATABASE_FILE_NAME]
+            self._synced[db.DATABASE_FILE_NAME] = (data_version, seq)
+
+        if seq % 100 == 0:
+            conn.execute(
+                "DELETE FROM changes WHERE seq <= ?", (seq - self.CHANGES_KEPT,)
+            )
+
+    def changed(self, db: "BaseDatabase") -> bool:
+        data_version, _ = self._synced[db.DATABASE_FILE_NAME]
+        return self._current_data_version() != data_version
+
+    def sync(self, db: "BaseDatabase"):
+        name = db.DATABASE_FILE_NAME
+        _, last = self._synced[name]
+        data_version = self._current_data_version()
+        (first,) = self.conn.execute(
+            "SELECT coalesce(min(seq), 0) FROM changes"
+        ).fetchone()
+        if first > last + 1:
+            # trimmed before we got to them
+            db.reload()
+            return
+
+        other_generation = 0
+        for seq, changed_db, row in self.conn.execute(
+            "SELECT seq, db, entry FROM changes WHERE seq > ? ORDER BY seq", (last,)
+        ).fetchall():
+            last = seq
+            if changed_db != name:
+                continue
+
+            entry = json.loads(row)
+            if entry["op"] == "reload":
+                db.reload()
+                return
+
+            if entry.get("gen", "") != db.generation:
+                other_generation += 1
+                continue
+
+            db.apply(entry)
+
+        _warn_other_generation(db, other_generation)
+        self._synced[name] = (data_version, last)
+
+    def replaced(self, db: "BaseDatabase") -> bool:
+        if not self.changed(db):
+            return False
+
+        name = db.DATABASE_FILE_NAME
+        _, last = self._synced[name]
+        (first,) = self.conn.execute(
+            "SELECT coalesce(min(seq), 0) FROM changes"
+        ).fetchone()
+        if first > last + 1:
+            return True
+
+        (reloads,) = self.conn.execute(
+            "SELECT count(*) FROM changes WHERE seq > ? AND db = ?"
+            " AND json_extract(entry, '$.op') = 'reload'",
+            (last, name),
+        ).fetchone()
+        return reloads > 0
+
+    def fingerprint(self, cls: type["BaseDatabase"]) -> Any:
+        return self._current_data_version()
+
+    def commit(self, db: "BaseDatabase", backup: bool = True):
+        self._ensure_schema(type(db))
+
+        with self.conn as conn:
+            for entry in db._journal:
+                self._log_change(conn, db, entry)
+                if entry["op"] == "note":
+                    conn.execute(
+                        "INSERT INTO notes (typ, key, ts, data) VALUES (?, ?, ?, ?)",
+                        self._note_row(entry["typ"], entry["id"], entry["note"]),
+                    )
+                elif entry["op"] == "put":
+                    conn.execute(
+                        f"INSERT OR REPLACE INTO {entry['collection']} (id, data)"
+                        " VALUES (?, ?)",
+                        (entry["id"], json.dumps(entry["data"])),
+                    )
+
+        db._journal.clear()
+
+    def checkpoint(self, db: "BaseDatabase", backup: bool = True):
+        self._ensure_schema(type(db))
+        records, notes = _collections(type(db))
+        dump = db.model_dump(mode="json", by_alias=True)
+
+        with self.conn as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (db, data) VALUES (?, ?)",
+                (
+                    db.DATABASE_FILE_NAME,
+                    json.dumps(
+                        {
+                            key: value
+                            for key, value in dump.items()
+                            if key not in records and key not in notes
+                        }
+                    ),
+                ),
+            )
+            for name in records:
+                conn.execute(f"DELETE FROM {name}")
+                conn.executemany(
+                    f"INSERT INTO {name} (id, data) VALUES (?, ?)",
+                    ((item["_id"], json.dumps(item)) for item in dump[name]),
+                )
+
+            self._log_change(conn, db, {"op": "reload"})
+
+            for typ in notes:
+                conn.execute("DELETE FROM notes WHERE typ = ?", (typ,))
+                conn.executemany(
+                    "INSERT INTO notes (typ, key, ts, data) VALUES (?, ?, ?, ?)",
+                    (
+                        self._note_row(typ, key, note)
+                        for key, key_notes in dump[typ].items()
+                        for note in reversed(key_notes)
+                    ),
+                )
+
+        db._journal.clear()
+
+        if backup:
+            get_coordinator().snapshot_later(db.DATABASE_FILE_NAME, lambda: dump)
+
+
+class CommitCoordinator:
+    def __init__(self, mode: str = DURABILITY, interval_ms: int = COMMIT_INTERVAL_MS):
+        self.mode = mode
+        self.interval = interval_ms / 1000
+        self._pending: dict[str, tuple[BaseDatabase, bool]] = {}
+        # DATABASE_FILE_NAME -> (database, backup) due for a checkpoint
+        self._checkpoints: dict[str, tuple[BaseDatabase, bool]] = {}
+        # (DATABASE_FILE_NAME, function returning the dump) to snapshot
+        self._snapshots: list[tuple[str, Callable[[], dict[str, Any]]]] = []
+        self._thread: threading.Thread | None = None
+
+    def submit(self, db: "BaseDatabase", backup: bool = True):
+        if self.mode == "sync":
+            with WRITE_LOCK:
+                db.flush(backup)
+            return
+
+        with WRITE_LOCK:
+            _, pending_backup = self._pending.get(db.DATABASE_FILE_NAME, (db, False))
+            self._pending[db.DATABASE_FILE_NAME] = (db, backup or pending_backup)
+        self._start()
+
+    def checkpoint_later(self, db: "BaseDatabase", backup: bool = True):
+        """Queue a checkpoint of `db`, so it doesn't hold up the commit that
+        made it due (under WRITE_LOCK)"""
+        _, pending_backup = self._checkpoints.get(db.DATABASE_FILE_NAME, (db, False))
+        self._checkpoints[db.DATABASE_FILE_NAME] = (db, backup or pending_backup)
+        self._start()
+
+    def snapshot_later(self, name: str, dump: Callable[[], dict[str, Any]]):
+        """Queue a snapshot of what `dump()` returns (under WRITE_LOCK)"""
+        self._snapshots.append((name, dump))
+        self._start()
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="car-commit", daemon=True
+            )
+            self._thread.start()
+
+    def flush(self):
+        """Write out everything queued so far, then take queued snapshots
+        (outside the lock)"""
+        if not (self._pending or self._checkpoints or self._snapshots):
+            return
+
+        with WRITE_LOCK:
+            for name, (db, backup) in list(self._pending.items()):
+                db.flush(backup)
+                # only once it's written, so a failed flush stays queued
+                del self._pending[name]
+
+            for name, (db, backup) in list(self._checkpoints.items()):
+                # (someone else may have checkpointed it meanwhile)
+                if get_storage().checkpoint_due(db):
+                    db.checkpoint(backup)
+                del self._checkpoints[name]
+
+            snapshots, self._snapshots = self._snapshots, []
+
+        for name, dump in snapshots:
+            take_snapshot(name, dump())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                # still queued (and journaled in memory); retry next round
+                logger.exception("flushing queued commits failed")
+
+
+@functools.cache
+def get_coordinator() -> CommitCoordinator:
+    coordinator = CommitCoordinator()
+    atexit.register(coordinator.flush)
+    return coordinator
+
+
+ENGINES: dict[str, type[Storage]] = {
+    "json": JSONStorage,
+    "sqlite": SQLiteStorage,
+}
+
+
+@functools.cache
+def get_storage() -> Storage:
+    return ENGINES[STORAGE_ENGINE]()
+
+
+class HotReloader:
+    """Picks up changes made to the loaded databases from outside the app,
+    e.g. by import_voters, without blocking requests: a replaced database is
+    loaded and validated on this thread, and only swapped in (in place, so
+    everything holding on to it carries on) by whoever takes WRITE_LOCK
+    next. Journal entries are just replayed.
+
+    Data is only read once its fingerprint has stayed the same for a whole
+    interval, and is thrown away if the fingerprint changed while it was
+    being read, so a half-written file is never picked up; one that fails
+    validation is skipped until it changes again."""
+
+    def __init__(self, interval: float = HOT_RELOAD_SECS):
+        self.interval = interval
+        # DATABASE_FILE_NAME -> fingerprint waiting to settle
+        self._settling: dict[str, Any] = {}
+        # DATABASE_FILE_NAME -> fingerprint that didn't validate
+        self._rejected: dict[str, Any] = {}
+        # DATABASE_FILE_NAME -> (database read, its sync state, fingerprint)
+        # waiting to be swapped in
+        self._ready: dict[str, tuple[BaseDatabase, Any, Any]] = {}
+        self._thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(
+                target=self._run, name="car-hot-reload", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception:
+                logger.exception("hot reload check failed")
+
+    def check(self):
+        storage = get_storage()
+        for name, db in list(DATABASES.items()):
+            if not storage.changed(db):
+                self._settling.pop(name, None)
+            elif not storage.replaced(db):
+                with WRITE_LOCK:
+                    if storage.changed(db):
+                        storage.sync(db)
+            else:
+                self._reload(storage, db)
+
+    def _reload(self, storage: Storage, db: "BaseDatabase"):
+        cls = type(db)
+        name = cls.DATABASE_FILE_NAME
+        fingerprint = storage.fingerprint(cls)
+        if self._settling.get(name) != fingerprint:
+            self._settling[name] = fingerprint
+            return
+
+        if self._rejected.get(name) == fingerprint:
+            return
+
+        try:
+            fresh, state = cls._read()
+        except ValueError:
+            # (pydantic's ValidationError is one)
+            logger.warning(
+                "not reloading %s until it changes again", name, exc_info=True
+            )
+            self._rejected[name] = fingerprint
+            return
+
+        if storage.fingerprint(cls) != fingerprint:
+            # changed while we were reading it
+            return
+
+        self._ready[name] = (fresh, state, fingerprint)
+        # taking the lock swaps it in, if that hasn't happened already
+        with WRITE_LOCK:
+            pass
+
+    def swap_in(self, storage: Storage, db: "BaseDatabase"):
+        """Reload `db` from the copy read in the background, if it has been
+        replaced and that copy is still current (under WRITE_LOCK)"""
+        cls = type(db)
+        name = cls.DATABASE_FILE_NAME
+        if name not in self._ready:
+            return
+
+        fresh, state, fingerprint = self._ready.pop(name)
+        if storage.fingerprint(cls) != fingerprint or not storage.replaced(db):
+            return
+
+        db.reload(fresh)
+        storage.adopt(cls, state)
+        self._settling.pop(name, None)
+        logger.info("reloaded %s", name)
+
+
+@functools.cache
+def get_hot_reloader() -> HotReloader:
+    return HotReloader()
@@ -0,0 +1,88 @@
+"""Everything the turf pages show about a turf's doors and voters, computed in
+one pass so templates don't look dispositions up door by door."""
+
+import itertools
+from collections import Counter
+from typing import Any
+
+from .model import Database, Disposition, Door, Note, Turf, Voter
+
+
+class VoterView:
+    __slots__ = ("voter", "disposition", "last_disposition", "last_note")
+
+    def __init__(self, voter: Voter, after: str | None):
+        self.voter = voter
+        # since the turf was started, for the turf pages' links
+        self.disposition = voter.last_disposition(after)
+        # ever, for the print view
+        self.last_disposition, self.last_note = voter.last_disposition_with_note()
+
+
+class DoorView:
+    __slots__ = ("door", "disposition", "voters", "sort_key", "print_order_key")
+
+    def __init__(self, door: Door, voters: list[VoterView], after: str | None):
+        self.door = door
+        self.voters = voters
+        self.disposition = door.last_disposition_with_voters(
+            [v.voter for v in voters], after
+        )
+        self.sort_key = door.sort_key()
+        self.print_order_key = door.print_order_key()
+
+    @property
+    def id(self):
+        return self.door.id
+
+
+class TurfView:
+    def __init__(self, db: Database, turf: Turf):
+        self.turf = turf
+        self.disposition: Disposition
+        self.disposition_note: Note | None
+        self.disposition, self.disposition_note = turf.last_disposition_with_note()
+        self.started_at = turf.started_at()
+
+        self.doors: list[DoorView] = []
+        for door_id in turf.doors:
+            door = db.doors[door_id]
+            voters = [VoterView(db.voters[v], self.started_at) for v in door.voters]
+            self.doors.append(DoorView(door, voters, self.started_at))
+
+        self.counts = Counter(d.disposition for d in self.doors)
+
+        # doors grouped by street and side (or building), in walking order
+        self.ordered_doors: list[tuple[Any, list[DoorView]]] = [
+            (key, list(doors))
+            for key, doors in itertools.groupby(
+                sorted(self.doors, key=lambda d: d.sort_key),
+                key=lambda d: d.print_order_key,
+            )
+        ]
+
+    def geojson(self, url_for_door) -> dict[str, Any]:
+        return {
+            "type": "FeatureCollection",
+            "crs": {
+                "type": "name",
+                "properties": {"name": "urn:ogc:def:crs:OGC:1.3:CRS84"},
+            },
+            "features": [
+                {
+                    "type": "Feature",
+                    "geometry": {
+                        "type": "Point",
+                        "coordinates": [d.door.lon, d.door.lat],
+                    },
+                    "properties": {
+                        "address": d.door.address,
+                        "unit": d.door.unit,
+                        "n_voters": len(d.voters),
+                        "url": url_for_door(d.id),
+                        "disposition": d.disposition,
+                    },
+                }
+                for d in self.doors
+            ],
+        }
@@ -1,5 +1,7 @@
 import datetime
-import subprocess
+import functools
+
+import segno
 
 
 def time_taken_sec(t_start, t_end):
@@ -60,25 +62,6 @@ def time_taken(t_start, t_end):
     return human_interval(time_taken_sec(t_start, t_end))
 
 
+@functools.lru_cache(maxsize=256)
 def qr_code(uri):
-    proc = subprocess.Popen(
-        "qrencode -t png -o- | base64 -w0",
-        shell=True,
-        text=True,
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-    )
-    out, _ = proc.communicate(uri)
-    return f"data:image/png;base64,{out}"
-
-
-class MemoryCache:
-    # swap out for redis if this is causing problems
-    def __init__(self):
-        self.data = {}
-
-    def get(self, key):
-        return self.data.get(key)
-
-    def set(self, key, value):
-        self.data[key] = value
+    return segno.make(uri, error="l", micro=False).png_data_uri(scale=3)